@@ -1,22 +1,13 @@
-import openai
-openai.api_key="your api_key"
 import os.path
 import json
-from langchain.prompts import PromptTemplate
-from langchain.chains import LLMChain
-from langchain_community.llms import Tongyi
+from nerStore import openNerDict
 
 langList = ['ar_AE','de_DE','fr_FR','es_ES','it_IT','ko_KR','th_TH','tr_TR','zh_TW',"ja_JP"]
 lang = "tr_TR"
 api_url = 'your api_url'
 api_key = 'your api_key'
-myDict = {}
-with open(nerDict_path, 'r', encoding='utf-8') as file:
-    for line in file:
-        data = json.loads(line.strip())
-        key = data.get('ne')
-    if key:
-        myDict[key] = data
+# Compiled to a memory-mapped store on first use; see nerStore.py.
+myDict = openNerDict(nerDict_path)
 CountryDict={
     "ar_AE":"ar",
     "de_DE":"de",
@@ -44,6 +35,10 @@ CountryDict2 = {
 }
 
 def translated_with_CoT(sentence,target_lang):
+    from langchain.prompts import PromptTemplate
+    from langchain.chains import LLMChain
+    from langchain_community.llms import Tongyi
+
     prompt = PromptTemplate(
     input_variables=["sentence", "myDict","target_lang","tl"],
     template="""
@@ -65,7 +60,9 @@ def translated_with_CoT(sentence,target_lang):
         base_url="your base_url"
     )
     llm_chain = LLMChain(prompt=prompt, llm=llm)
-    translated_sentence = llm_chain.run({"sentence": sentence, "myDict": myDict,"target_lang":target_lang,"tl":CountryDict2[target_lang]})
+    # Only the entries that occur in the sentence, in the target locale.
+    sentenceDict = dict(myDict.findIn(sentence, target_lang))
+    translated_sentence = llm_chain.run({"sentence": sentence, "myDict": sentenceDict,"target_lang":target_lang,"tl":CountryDict2[target_lang]})
     translated_lines = translated_sentence.strip().split("\n")
     last_line = translated_lines[-1] if translated_lines else ""
     processed_result = last_line.strip()
@@ -0,0 +1,99 @@
+import ast
+import importlib.util
+import json
+import math
+import os.path
+
+# Every translation path we run, as (script, translate function). The scripts read
+# their paths and keys from module globals, so loading them through loadScript lets
+# the same code be pointed at the real services, at local stubs or at another dictionary.
+BACKENDS = {
+    "m2m": ("semevalTask2.py", "translate_sentence_with_m2m"),
+    "qwenmt": ("semevalTask2.py", "translate_sentence_with_QwenMT"),
+    "deepseek": ("tryDeepSeek(zh&tr).py", "translate_with_DeepSeek"),
+    "cot": ("CoTBased.py", "translated_with_CoT"),
+}
+
+# Backends whose pipeline can also hand back its payload (entities, lookups, ...).
+PAYLOAD_FUNCTIONS = {
+    "m2m": "translate_payload_with_m2m",
+    "qwenmt": "translate_payload_with_QwenMT",
+}
+
+implementDir = os.path.dirname(os.path.abspath(__file__))
+dataPath = os.path.join(implementDir, "..", "ea-mt-eval", "data", "references")
+predictionsPath = os.path.join(implementDir, "..", "ea-mt-eval", "data", "predictions")
+
+langList = ['ar_AE','de_DE','fr_FR','es_ES','it_IT','ko_KR','th_TH','tr_TR','zh_TW',"ja_JP"]
+
+
+def loadScript(fileName, **overrides):
+    path = os.path.join(implementDir, fileName)
+    moduleName = os.path.splitext(fileName)[0].replace("(", "_").replace(")", "_").replace("&", "_")
+    spec = importlib.util.spec_from_file_location(moduleName, path)
+    module = importlib.util.module_from_spec(spec)
+    # Globals such as nerDict_path are only defined by whoever runs the script,
+    # so they have to exist before the module body is executed; the ones the
+    # script defines itself (wikidata_url, api_url, ...) are replaced afterwards.
+    module.__dict__.update(overrides)
+    spec.loader.exec_module(module)
+    module.__dict__.update(overrides)
+    return module
+
+
+def getTranslator(name, locale, module=None, **overrides):
+    fileName, funcName = BACKENDS[name]
+    if module is None:
+        module = loadScript(fileName, **overrides)
+    else:
+        module.__dict__.update(overrides)
+    # semevalTask2 picks the QwenMT target language from the global lang.
+    module.lang = locale
+    translate = getattr(module, funcName)
+    targetLang = locale.split("_")[0]
+
+    def translator(sentence):
+        return translate(sentence, targetLang)
+    return translator
+
+
+def percentile(values, q):
+    # Nearest-rank percentile, 0.0 for no values.
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    idx = min(len(ordered) - 1, max(0, math.ceil(q / 100.0 * len(ordered)) - 1))
+    return ordered[idx]
+
+
+def parseOverrides(pairs):
+    # NAME=VALUE pairs from --set. Values are read as JSON (false, 3, null,
+    # [...]) or as Python literals (False, None) when they parse, and kept as
+    # strings otherwise, so --set protect_entities=False really turns it off.
+    overrides = {}
+    for pair in pairs or []:
+        key, _, value = pair.partition("=")
+        try:
+            overrides[key] = json.loads(value)
+        except ValueError:
+            try:
+                overrides[key] = ast.literal_eval(value)
+            except (ValueError, SyntaxError):
+                overrides[key] = value
+    return overrides
+
+
+def readReferences(split, locale):
+    with open(os.path.join(dataPath, split, f"{locale}.jsonl"), 'r', encoding='utf-8') as data_file:
+        return [json.loads(line.strip()) for line in data_file if line.strip()]
+
+
+def submissionRecord(item, prediction):
+    return {
+        "id": item["id"],
+        "source_language": item["source_locale"],
+        "target_language": item["target_locale"],
+        "text": item["source"],
+        "prediction": prediction
+    }
+
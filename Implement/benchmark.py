@@ -0,0 +1,315 @@
+import argparse
+import json
+import multiprocessing
+import os.path
+import queue
+import resource
+import subprocess
+import tempfile
+import time
+
+from backends import BACKENDS, langList, readReferences, getTranslator, loadScript, implementDir, percentile
+from stubServers import buildFixtures, writeNerDict, startStubs, stopStubs
+
+# Offline throughput benchmark: every pipeline is driven over the references of a
+# split against the local stubs, each in a fresh process so that peak RSS belongs
+# to that pipeline alone. With --startup only the import and the first sentence
+# are timed. One line per (commit, pipeline) is appended to the
+# results file and compared with the last run of an earlier commit.
+
+resultsPath = os.path.join(implementDir, "benchmarks", "results.jsonl")
+
+
+def peakRssMb():
+    # ru_maxrss is in kilobytes on Linux.
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0
+
+
+def stubOverrides(urls, nerDictPath):
+    return {
+        "wikidata_url": urls["wikidata"],
+        "api_url": urls["chat"] + "/v1",
+        "api_key_QwenMax": "stub",
+        "ollama_url": urls["ollama"] + "/api/generate",
+        "nerDict_path": nerDictPath,
+        "NerDict_jsonl_file": nerDictPath,
+    }
+
+
+def runPipelined(module, name, locale, items, latencies):
+    # Latency of a sentence runs from the moment the stage runner takes it
+    # from the input until it comes out in order.
+    fedAt = {}
+
+    def feed():
+        for idx, item in enumerate(items):
+            fedAt[idx] = time.perf_counter()
+            yield item["source"]
+
+    module.lang = locale
+    backend = "m2m" if name == "m2m" else "QwenMT"
+    errors = 0
+    results = module.translate_sentences_pipelined(feed(), locale.split("_")[0], backend)
+    for idx, (payload, error) in enumerate(results):
+        latencies.append(time.perf_counter() - fedAt[idx])
+        if error is not None:
+            errors += 1
+    return errors
+
+
+def runPipeline(name, split, locales, limit, overrides, pipelined, resultQueue):
+    if name == "cot":
+        import dashscope
+        dashscope.base_http_api_url = overrides["api_url"][:-len("/v1")] + "/api/v1"
+
+    start = time.perf_counter()
+    module = loadScript(BACKENDS[name][0], **overrides)
+    loadSeconds = time.perf_counter() - start
+
+    latencies = []
+    errors = 0
+    start = time.perf_counter()
+    for locale in locales:
+        if pipelined:
+            errors += runPipelined(module, name, locale, readReferences(split, locale)[:limit], latencies)
+            continue
+        translate = getTranslator(name, locale, module=module)
+        for item in readReferences(split, locale)[:limit]:
+            sentenceStart = time.perf_counter()
+            try:
+                translate(item["source"])
+            except Exception as e:
+                errors += 1
+            latencies.append(time.perf_counter() - sentenceStart)
+    seconds = time.perf_counter() - start
+
+    result = {
+        "sentences": len(latencies),
+        "errors": errors,
+        "load_seconds": round(loadSeconds, 3),
+        "seconds": round(seconds, 3),
+        "sentences_per_sec": round(len(latencies) / seconds, 3) if seconds > 0 else 0.0,
+        "p50_ms": round(1000 * percentile(latencies, 50), 2),
+        "p99_ms": round(1000 * percentile(latencies, 99), 2),
+        "peak_rss_mb": round(peakRssMb(), 1),
+    }
+    if getattr(module, "protect_entities", False):
+        from placeholders import placeholderStats
+        result["placeholders"] = placeholderStats
+    if getattr(module, "ne_cache_path", None):
+        result["ne_cache_stats"] = module.getNeCache().stats()
+    resultQueue.put(result)
+
+
+def runCascade(tiers, split, locales, limit, overrides, pipelined, resultQueue):
+    from cascade import Cascade
+
+    start = time.perf_counter()
+    cascade = Cascade(tiers, overrides, overrides["nerDict_path"])
+    loadSeconds = time.perf_counter() - start
+
+    errors = 0
+    count = 0
+    start = time.perf_counter()
+    for locale in locales:
+        for item in readReferences(split, locale)[:limit]:
+            count += 1
+            try:
+                cascade.translate(item["source"], locale)
+            except Exception as e:
+                errors += 1
+    seconds = time.perf_counter() - start
+
+    summary = cascade.summary()
+    resultQueue.put({
+        "sentences": count,
+        "errors": errors,
+        "load_seconds": round(loadSeconds, 3),
+        "seconds": round(seconds, 3),
+        "sentences_per_sec": round(count / seconds, 3) if seconds > 0 else 0.0,
+        "escalation_rate": summary["escalation_rate"],
+        "cost": summary["cost"],
+        "last_tier_cost": summary["last_tier_cost"],
+        "tiers": summary["tiers"],
+        "peak_rss_mb": round(peakRssMb(), 1),
+    })
+
+
+def runStartup(name, split, locales, limit, overrides, pipelined, resultQueue):
+    # Cost of getting to the first translation: importing the script (and
+    # whatever it imports or loads at module level), then the first sentence,
+    # which is where lazily loaded models and clients are paid for.
+    if name == "cot":
+        import dashscope
+        dashscope.base_http_api_url = overrides["api_url"][:-len("/v1")] + "/api/v1"
+
+    start = time.perf_counter()
+    module = loadScript(BACKENDS[name][0], **overrides)
+    importSeconds = time.perf_counter() - start
+    importRss = peakRssMb()
+
+    item = readReferences(split, locales[0])[0]
+    translate = getTranslator(name, locales[0], module=module)
+    start = time.perf_counter()
+    try:
+        translate(item["source"])
+    except Exception as e:
+        print(f"{e}")
+    firstSeconds = time.perf_counter() - start
+
+    resultQueue.put({
+        "import_seconds": round(importSeconds, 3),
+        "import_rss_mb": round(importRss, 1),
+        "first_sentence_seconds": round(firstSeconds, 3),
+        "startup_seconds": round(importSeconds + firstSeconds, 3),
+        "peak_rss_mb": round(peakRssMb(), 1),
+    })
+
+
+def runIsolated(target, *args):
+    context = multiprocessing.get_context("spawn")
+    resultQueue = context.Queue()
+    process = context.Process(target=target, args=args + (resultQueue,))
+    process.start()
+    # The result is read before joining: a child only exits once the queue
+    # has been drained, so joining first deadlocks on large results.
+    result = None
+    while result is None:
+        try:
+            result = resultQueue.get(timeout=1.0)
+        except queue.Empty:
+            if not process.is_alive():
+                try:
+                    result = resultQueue.get(timeout=1.0)
+                except queue.Empty:
+                    pass
+                break
+    process.join()
+    if result is None or process.exitcode != 0:
+        return {"failed": True, "exitcode": process.exitcode}
+    return result
+
+
+def currentCommit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=implementDir,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except Exception as e:
+        return "unknown"
+
+
+def loadResults(path=resultsPath):
+    if not os.path.exists(path):
+        return []
+    with open(path, 'r', encoding='utf-8') as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def saveResult(record, path=resultsPath):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'a', encoding='utf-8') as f:
+        json.dump(record, f, ensure_ascii=False)
+        f.write('\n')
+
+
+def sameSetup(a, b):
+    keys = ["benchmark", "pipeline", "split", "locales", "limit", "stubs", "worker", "pipelined", "protect", "ne_cache"]
+    return all(a.get(k) == b.get(k) for k in keys)
+
+
+def compareWithPrevious(record, history):
+    previous = [r for r in history if sameSetup(r, record) and r["commit"] != record["commit"]]
+    if not previous:
+        return
+    last = previous[-1]
+    for metric in ["sentences_per_sec", "p50_ms", "p99_ms", "import_seconds", "import_rss_mb",
+                   "first_sentence_seconds", "startup_seconds", "peak_rss_mb"]:
+        if metric in record and last.get(metric):
+            change = 100.0 * (record[metric] - last[metric]) / last[metric]
+            print(f"    {metric:18s} {last[metric]:>10} -> {record[metric]:>10} ({change:+.1f}% vs {last['commit']})")
+
+
+def report(record, history):
+    name = record["pipeline"]
+    if record.get("failed"):
+        print(f"{name}: failed with exit code {record['exitcode']}")
+        return
+    metrics = ", ".join(f"{k}={v}" for k, v in record.items()
+                        if k not in ("benchmark", "commit", "time", "pipeline", "split", "locales", "limit", "stubs", "worker", "pipelined", "protect", "ne_cache"))
+    print(f"{name}: {metrics}")
+    compareWithPrevious(record, history)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline throughput benchmark of the translation pipelines.")
+    parser.add_argument("--pipelines", nargs="+", default=list(BACKENDS), choices=list(BACKENDS))
+    parser.add_argument("--split", default="validation")
+    parser.add_argument("--locales", nargs="+", default=langList)
+    parser.add_argument("--limit", type=int, default=50, help="sentences per locale")
+    parser.add_argument("--latency", type=float, default=0.05, help="seconds added to every stub request")
+    parser.add_argument("--jitter", type=float, default=0.02)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--startup", action="store_true",
+                        help="measure import time and time to the first sentence instead of throughput")
+    parser.add_argument("--pipelined", action="store_true",
+                        help="run m2m and qwenmt through the overlapping stage runner")
+    parser.add_argument("--protect", action="store_true",
+                        help="use placeholder entity protection in m2m and qwenmt")
+    parser.add_argument("--cascade", nargs="+", metavar="TIER", choices=list(BACKENDS),
+                        help="run one cascade over these tiers instead of the separate pipelines")
+    parser.add_argument("--ne-cache", action="store_true",
+                        help="share one NE extraction cache across the locales and pipelines of the run")
+    parser.add_argument("--worker-url", help="run the m2m pipeline against a running inferenceWorker.py")
+    parser.add_argument("--results", default=resultsPath)
+    parser.add_argument("--no-save", action="store_true")
+    args = parser.parse_args()
+    if args.cascade and args.startup:
+        parser.error("--startup does not apply to --cascade")
+
+    fixtures = buildFixtures(args.split, args.locales)
+    stubConfig = {"latency": args.latency, "jitter": args.jitter, "error_rate": args.error_rate}
+    servers = startStubs(fixtures, {name: stubConfig for name in ("wikidata", "chat", "ollama")})
+    history = loadResults(args.results)
+    commit = currentCommit()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        nerDictPath = os.path.join(tmp, "nerDict.jsonl")
+        writeNerDict(fixtures, nerDictPath)
+        overrides = stubOverrides({name: server.url for name, server in servers.items()}, nerDictPath)
+        if args.worker_url:
+            overrides["worker_url"] = args.worker_url
+        if args.protect:
+            overrides["protect_entities"] = True
+        if args.ne_cache:
+            overrides["ne_cache_path"] = os.path.join(tmp, "neCache.sqlite")
+        try:
+            pipelines = ["cascade:" + "+".join(args.cascade)] if args.cascade else args.pipelines
+            for name in pipelines:
+                record = {
+                    "benchmark": "cascade" if args.cascade else "startup" if args.startup else "throughput",
+                    "commit": commit,
+                    "time": time.strftime("%Y-%m-%d %H:%M:%S"),
+                    "pipeline": name,
+                    "split": args.split,
+                    "locales": args.locales[:1] if args.startup else args.locales,
+                    "limit": 1 if args.startup else args.limit,
+                    "stubs": stubConfig,
+                    "worker": bool(args.worker_url),
+                    "pipelined": args.pipelined and name in ("m2m", "qwenmt"),
+                    "protect": args.protect and (bool(args.cascade) or name in ("m2m", "qwenmt")),
+                    "ne_cache": args.ne_cache,
+                }
+                target = runStartup if args.startup else runPipeline
+                if args.cascade:
+                    target, name = runCascade, args.cascade
+                record.update(runIsolated(target, name, args.split, record["locales"], record["limit"],
+                                          overrides, record["pipelined"]))
+                report(record, history)
+                if not args.no_save and not record.get("failed"):
+                    saveResult(record, args.results)
+        finally:
+            stopStubs(servers)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,179 @@
+import argparse
+import json
+import os
+import re
+import time
+
+from backends import BACKENDS, PAYLOAD_FUNCTIONS, langList, readReferences, getTranslator, loadScript, parseOverrides, percentile, predictionsPath, submissionRecord
+from nerStore import openNerDict
+
+# Cascade translation: every sentence goes to the first (cheapest) tier and is
+# only sent on to the next tier when the output fails the entity check:
+#
+#   python cascade.py --tiers m2m qwenmt deepseek --split test --ner-dict nerDict.jsonl --system Cascade
+#
+# The check looks for the target-language labels the sentence should contain:
+# the NER dictionary entries found in the source, and the Wikidata lookups the
+# m2m and qwenmt pipelines make on the way. A tier passes when every entity has
+# one of its labels in the output. When no label is known the local m2m output
+# cannot be verified and escalates, while an LLM tier is trusted. The last tier
+# is always accepted.
+
+# Price of one sentence per tier, in LLM-call units unless set with --price.
+defaultPrices = {"m2m": 0.0}
+
+
+class Cascade:
+    def __init__(self, tiers, overrides=None, nerDictPath=None, prices=None):
+        self.tiers = tiers
+        self.store = openNerDict(nerDictPath) if nerDictPath else None
+        self.prices = dict(defaultPrices, **(prices or {}))
+        self.modules = {}
+        for name in tiers:
+            fileName = BACKENDS[name][0]
+            if fileName not in self.modules:
+                self.modules[fileName] = loadScript(fileName, **(overrides or {}))
+        self.stats = {name: {"sentences": 0, "accepted": 0, "errors": 0, "unverified": 0, "seconds": []}
+                      for name in tiers}
+
+    def runTier(self, name, sentence, locale):
+        module = self.modules[BACKENDS[name][0]]
+        if name in PAYLOAD_FUNCTIONS:
+            module.lang = locale
+            payload = getattr(module, PAYLOAD_FUNCTIONS[name])(sentence, locale.split("_")[0])
+            lookups = [(lookup["entity"], lookup["translation"]) for lookup in payload.get("lookups", [])]
+            return payload["translation"], lookups
+        return getTranslator(name, locale, module=module)(sentence), []
+
+    def passes(self, translation, expected):
+        normalized = translation.casefold()
+        return all(any(label.casefold() in normalized for label in labels) for labels in expected.values())
+
+    def dictionaryMatches(self, sentence, locale):
+        # findIn also returns names inside longer ones ("New York" within "New
+        # York City"); only the outermost match of a mention is expected.
+        kept = []
+        spans = []
+        for ne, label in self.store.findIn(sentence, locale):
+            outside = False
+            for match in re.finditer(rf"(?<!\w){re.escape(ne)}(?!\w)", sentence):
+                start, end = match.span()
+                if not any(keptStart <= start and end <= keptEnd for keptStart, keptEnd in spans):
+                    outside = True
+                    spans.append((start, end))
+            if outside:
+                kept.append((ne, label))
+        return kept
+
+    def translate(self, sentence, locale):
+        # expected: entity (casefolded) -> every label seen for it
+        expected = {}
+        if self.store is not None:
+            for ne, label in self.dictionaryMatches(sentence, locale):
+                expected.setdefault(ne.casefold(), set()).add(label)
+
+        for idx, name in enumerate(self.tiers):
+            stats = self.stats[name]
+            last = idx == len(self.tiers) - 1
+            stats["sentences"] += 1
+            start = time.perf_counter()
+            try:
+                translation, lookups = self.runTier(name, sentence, locale)
+            except Exception as e:
+                stats["errors"] += 1
+                if last:
+                    raise
+                continue
+            finally:
+                stats["seconds"].append(time.perf_counter() - start)
+
+            for entity, label in lookups:
+                expected.setdefault(entity.casefold(), set()).add(label)
+            if not expected:
+                stats["unverified"] += 1
+                accepted = last or name != "m2m"
+            else:
+                accepted = last or self.passes(translation, expected)
+            if accepted:
+                stats["accepted"] += 1
+                return translation, name
+
+    def summary(self):
+        total = self.stats[self.tiers[0]]["sentences"]
+        tiers = {}
+        cost = 0.0
+        for name in self.tiers:
+            stats = self.stats[name]
+            tierCost = stats["sentences"] * self.prices.get(name, 1.0)
+            cost += tierCost
+            tiers[name] = {
+                "sentences": stats["sentences"],
+                "accepted": stats["accepted"],
+                "errors": stats["errors"],
+                "unverified": stats["unverified"],
+                "p50_ms": round(1000 * percentile(stats["seconds"], 50), 2),
+                "p95_ms": round(1000 * percentile(stats["seconds"], 95), 2),
+                "cost": round(tierCost, 4),
+            }
+        escalated = total - self.stats[self.tiers[0]]["accepted"]
+        return {
+            "sentences": total,
+            "escalation_rate": round(escalated / total, 4) if total else 0.0,
+            "cost": round(cost, 4),
+            # What the same sentences cost when all of them go to the last tier.
+            "last_tier_cost": round(total * self.prices.get(self.tiers[-1], 1.0), 4),
+            "tiers": tiers,
+        }
+
+    def report(self):
+        summary = self.summary()
+        print(f"{summary['sentences']} sentences, {100. * summary['escalation_rate']:.1f}% escalated past "
+              f"{self.tiers[0]}, cost {summary['cost']} (all on {self.tiers[-1]}: {summary['last_tier_cost']})")
+        for name, tier in summary["tiers"].items():
+            print(f"  {name:10s} {tier['sentences']:6d} in, {tier['accepted']:6d} accepted, {tier['errors']} errors, "
+                  f"{tier['unverified']} unverified, p50 {tier['p50_ms']} ms, p95 {tier['p95_ms']} ms, cost {tier['cost']}")
+        return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Translate with a cascade of backends, cheapest first.")
+    parser.add_argument("--tiers", nargs="+", default=["m2m", "qwenmt", "deepseek"], choices=list(BACKENDS))
+    parser.add_argument("--split", default="test")
+    parser.add_argument("--locales", nargs="+", default=langList)
+    parser.add_argument("--limit", type=int, help="sentences per locale")
+    parser.add_argument("--ner-dict", help="NER dictionary JSONL used for the check and by the scripts")
+    parser.add_argument("--price", action="append", metavar="TIER=PRICE",
+                        help="price of one sentence on a tier, e.g. deepseek=0.002")
+    parser.add_argument("--set", action="append", metavar="NAME=VALUE",
+                        help="module global for the scripts, e.g. api_key_QwenMax=...")
+    parser.add_argument("--system", help="write the predictions to data/predictions/{system}/{split}")
+    args = parser.parse_args()
+
+    overrides = parseOverrides(args.set)
+    if args.ner_dict:
+        overrides.setdefault("nerDict_path", args.ner_dict)
+        overrides.setdefault("NerDict_jsonl_file", args.ner_dict)
+    prices = {name: float(price) for name, price in parseOverrides(args.price).items()}
+    cascade = Cascade(args.tiers, overrides, args.ner_dict, prices)
+
+    for locale in args.locales:
+        records = []
+        for item in readReferences(args.split, locale)[:args.limit]:
+            try:
+                translation, tier = cascade.translate(item["source"], locale)
+                records.append(submissionRecord(item, translation))
+            except Exception as e:
+                print(f"{item['id']}: {e}")
+        if args.system:
+            saveDir = os.path.join(predictionsPath, args.system, args.split)
+            os.makedirs(saveDir, exist_ok=True)
+            with open(os.path.join(saveDir, f"{locale}.jsonl"), 'w', encoding='utf-8') as f:
+                for record in records:
+                    json.dump(record, f, ensure_ascii=False)
+                    f.write('\n')
+        print(f"{locale}: {len(records)} translated")
+    cascade.report()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,186 @@
+import argparse
+import hashlib
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from backends import BACKENDS, PAYLOAD_FUNCTIONS, langList, readReferences, getTranslator, loadScript, parseOverrides, predictionsPath, submissionRecord
+
+# Incremental re-translation. A `translate` run writes, next to every submission
+# file, a deps/{locale}.jsonl sidecar with what each sentence depended on and a
+# content hash of each: the Wikidata lookups of the m2m/qwenmt pipelines (with
+# the entities they were made for), or the NER dictionary entries found in the
+# source for deepseek/cot. `update` recomputes only those dependencies (lookups
+# are queried again, the dictionary is re-read) and re-translates the sentences
+# whose dependencies changed, splicing them into the submission by id:
+#
+#   python incremental.py translate --backend qwenmt --split test --system QwenAPI
+#   python incremental.py update --backend qwenmt --split test --system QwenAPI
+
+# The lookup stage that is re-run to check the dependencies of each payload backend.
+lookupStages = {
+    "m2m": "lookup_entities_for_m2m",
+    "qwenmt": "lookup_entities_for_Qwen",
+}
+
+
+def contentHash(value):
+    return hashlib.sha256(json.dumps(value, ensure_ascii=False, sort_keys=True).encode('utf-8')).hexdigest()[:16]
+
+
+def hashedLookups(lookups):
+    return [{"entity": lookup["entity"], "hash": contentHash(lookup)} for lookup in lookups]
+
+
+def hashedEntries(matches):
+    return [{"ne": ne, "hash": contentHash(label)} for ne, label in matches]
+
+
+def translateWithDeps(backend, module, item, locale):
+    targetLang = locale.split("_")[0]
+    deps = {"id": item["id"], "source": contentHash(item["source"])}
+    if backend in PAYLOAD_FUNCTIONS:
+        module.lang = locale
+        payload = getattr(module, PAYLOAD_FUNCTIONS[backend])(item["source"], targetLang)
+        deps["entities"] = payload["entities"]
+        deps["lookups"] = hashedLookups(payload["lookups"])
+        return payload["translation"], deps
+    translation = getTranslator(backend, locale, module=module)(item["source"])
+    deps["dictionary"] = hashedEntries(module.myDict.findIn(item["source"], targetLang))
+    return translation, deps
+
+
+def currentDeps(backend, module, item, locale, deps):
+    # The same record as translateWithDeps, without translating: the recorded
+    # entities are looked up again instead of being extracted again.
+    targetLang = locale.split("_")[0]
+    current = {"id": item["id"], "source": contentHash(item["source"])}
+    if "lookups" in deps:
+        payload = {"sentence": item["source"], "targetLang": targetLang, "entities": deps["entities"]}
+        payload = getattr(module, lookupStages[backend])(payload)
+        current["entities"] = deps["entities"]
+        current["lookups"] = hashedLookups(payload["lookups"])
+    if "dictionary" in deps:
+        current["dictionary"] = hashedEntries(module.myDict.findIn(item["source"], targetLang))
+    return current
+
+
+def changedDeps(old, new):
+    if old["source"] != new["source"]:
+        return ["source"]
+    changes = []
+    for kind, name in (("lookups", "entity"), ("dictionary", "ne")):
+        before = {dep[name]: dep["hash"] for dep in old.get(kind, [])}
+        after = {dep[name]: dep["hash"] for dep in new.get(kind, [])}
+        changes += [f"{kind}:{key}" for key in sorted(set(before) | set(after)) if before.get(key) != after.get(key)]
+    return changes
+
+
+def readJsonl(path):
+    if not os.path.exists(path):
+        return {}
+    with open(path, 'r', encoding='utf-8') as f:
+        records = [json.loads(line) for line in f if line.strip()]
+    return {record["id"]: record for record in records}
+
+
+def writeJsonl(path, records):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmpPath = f"{path}.{os.getpid()}.tmp"
+    with open(tmpPath, 'w', encoding='utf-8') as f:
+        for record in records:
+            json.dump(record, f, ensure_ascii=False)
+            f.write('\n')
+    os.replace(tmpPath, path)
+
+
+def depsPath(saveDir, locale):
+    return os.path.join(saveDir, "deps", f"{locale}.jsonl")
+
+
+def translateLocale(backend, module, items, locale, predictions, deps):
+    failed = 0
+    for item in items:
+        try:
+            translation, itemDeps = translateWithDeps(backend, module, item, locale)
+        except Exception as e:
+            failed += 1
+            print(f"{item['id']}: {e}")
+            continue
+        predictions[item["id"]] = submissionRecord(item, translation)
+        deps[item["id"]] = itemDeps
+    return failed
+
+
+def saveLocale(saveDir, locale, items, predictions, deps):
+    # In reference order, so a spliced file looks like a fresh one.
+    writeJsonl(os.path.join(saveDir, f"{locale}.jsonl"), [predictions[item["id"]] for item in items if item["id"] in predictions])
+    writeJsonl(depsPath(saveDir, locale), [deps[item["id"]] for item in items if item["id"] in deps])
+
+
+def findStale(backend, module, items, locale, predictions, deps, workers):
+    def check(item):
+        old = deps.get(item["id"])
+        if old is None or item["id"] not in predictions:
+            return item, ["missing"]
+        try:
+            return item, changedDeps(old, currentDeps(backend, module, item, locale, old))
+        except Exception as e:
+            # A failed check keeps the current translation; the next update tries again.
+            print(f"{item['id']}: could not check dependencies: {e}")
+            return item, []
+
+    # Checking is lookups and dictionary reads only, so it runs on threads. A
+    # failed Wikidata request must fail the check rather than look like a label
+    # that disappeared.
+    module.lang = locale
+    module.raise_lookup_errors = True
+    try:
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            return [(item, changes) for item, changes in pool.map(check, items) if changes]
+    finally:
+        module.raise_lookup_errors = False
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Translate with dependency tracking, or re-translate what changed.")
+    parser.add_argument("command", choices=["translate", "update"])
+    parser.add_argument("--backend", choices=list(BACKENDS), required=True)
+    parser.add_argument("--split", default="test")
+    parser.add_argument("--locales", nargs="+", default=langList)
+    parser.add_argument("--system", required=True, help="data/predictions/{system}/{split} holds the submission")
+    parser.add_argument("--limit", type=int, help="sentences per locale")
+    parser.add_argument("--workers", type=int, default=8, help="threads checking dependencies in update")
+    parser.add_argument("--dry-run", action="store_true", help="only list the sentences update would re-translate")
+    parser.add_argument("--set", action="append", metavar="NAME=VALUE",
+                        help="module global for the script, e.g. api_key_QwenMax=... or nerDict_path=...")
+    args = parser.parse_args()
+
+    module = loadScript(BACKENDS[args.backend][0], **parseOverrides(args.set))
+    saveDir = os.path.join(predictionsPath, args.system, args.split)
+
+    for locale in args.locales:
+        references = readReferences(args.split, locale)
+        items = references[:args.limit]
+        if args.command == "translate":
+            predictions, deps = {}, {}
+            failed = translateLocale(args.backend, module, items, locale, predictions, deps)
+            saveLocale(saveDir, locale, references, predictions, deps)
+            print(f"{locale}: {len(predictions)} translated, {failed} failed")
+            continue
+
+        predictions = readJsonl(os.path.join(saveDir, f"{locale}.jsonl"))
+        deps = readJsonl(depsPath(saveDir, locale))
+        stale = findStale(args.backend, module, items, locale, predictions, deps, args.workers)
+        for item, changes in stale:
+            print(f"{item['id']}: {', '.join(changes)}")
+        if args.dry_run or not stale:
+            print(f"{locale}: {len(stale)} of {len(items)} sentences stale")
+            continue
+        failed = translateLocale(args.backend, module, [item for item, changes in stale], locale, predictions, deps)
+        saveLocale(saveDir, locale, references, predictions, deps)
+        print(f"{locale}: re-translated {len(stale) - failed} of {len(items)} sentences, {failed} failed")
+
+
+if __name__ == "__main__":
+    main()
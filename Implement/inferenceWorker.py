@@ -0,0 +1,182 @@
+import argparse
+import json
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+
+# Long-lived process that keeps the NER and M2M100 pipelines loaded and serves
+# them over HTTP, so repeated per-locale runs and several scripts share one warm
+# copy of the weights. Requests arriving within max_wait seconds of each other
+# are coalesced into one pipeline call of at most max_batch sentences.
+#
+#   python inferenceWorker.py --port 8811
+#   semevalTask2.worker_url = "http://127.0.0.1:8811"
+
+worker_url = "http://127.0.0.1:8811"
+
+
+class MicroBatcher:
+    def __init__(self, runBatch, max_batch=16, max_wait=0.01):
+        # runBatch(key, payloads) -> one result per payload; items are only
+        # batched together when their key (task and languages) is the same.
+        self.runBatch = runBatch
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self.queue = queue.Queue()
+        self.batches = 0
+        self.items = 0
+        threading.Thread(target=self.loop, daemon=True).start()
+
+    def submit(self, key, payload):
+        future = Future()
+        self.queue.put((key, payload, future))
+        return future
+
+    def loop(self):
+        while True:
+            pending = [self.queue.get()]
+            deadline = time.monotonic() + self.max_wait
+            while len(pending) < self.max_batch:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    pending.append(self.queue.get(timeout=timeout))
+                except queue.Empty:
+                    break
+
+            groups = {}
+            for item in pending:
+                groups.setdefault(item[0], []).append(item)
+            for key, items in groups.items():
+                self.batches += 1
+                self.items += len(items)
+                try:
+                    results = self.runBatch(key, [payload for _, payload, _ in items])
+                    for (_, _, future), result in zip(items, results):
+                        future.set_result(result)
+                except Exception as e:
+                    for _, _, future in items:
+                        future.set_exception(e)
+
+
+def toJsonable(value):
+    # NER scores come back as numpy floats.
+    if isinstance(value, dict):
+        return {k: toJsonable(v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [toJsonable(v) for v in value]
+    if hasattr(value, "item"):
+        return value.item()
+    return value
+
+
+def runModelBatch(key, texts):
+    import semevalTask2
+    if key[0] == "ner":
+        pipe = semevalTask2.getNerPipe()
+        return [toJsonable(result) for result in pipe(texts, batch_size=len(texts))]
+
+    _, sourceLang, targetLang = key
+    m2m = semevalTask2.getM2M()
+    m2m.tokenizer.src_lang = sourceLang
+    m2m.generation_config.forced_bos_token_id = m2m.tokenizer.get_lang_id(targetLang)
+    return [result["generated_text"] for result in m2m(texts, batch_size=len(texts))]
+
+
+class WorkerServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, batcher):
+        super().__init__(address, WorkerHandler)
+        self.batcher = batcher
+
+
+class WorkerHandler(BaseHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+    def reply(self, status, body):
+        data = json.dumps(body, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        batcher = self.server.batcher
+        if self.path == "/stats":
+            self.reply(200, {
+                "batches": batcher.batches,
+                "items": batcher.items,
+                "mean_batch": round(batcher.items / batcher.batches, 2) if batcher.batches else 0.0,
+            })
+        elif self.path == "/health":
+            self.reply(200, {"status": "ok"})
+        else:
+            self.reply(404, {"error": "not found"})
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        body = json.loads(self.rfile.read(length) or b"{}")
+        if self.path == "/ner":
+            key = ("ner",)
+        elif self.path == "/translate":
+            key = ("translate", body.get("src_lang", "en"), body["tgt_lang"])
+        else:
+            self.reply(404, {"error": "not found"})
+            return
+        texts = body["texts"] if "texts" in body else [body["text"]]
+        futures = [self.server.batcher.submit(key, text) for text in texts]
+        try:
+            results = [future.result() for future in futures]
+        except Exception as e:
+            self.reply(500, {"error": f"{e}"})
+            return
+        self.reply(200, {"results": results})
+
+
+def requestWorker(url, task, texts, **params):
+    response = requests.post(f"{url}/{task}", json=dict(params, texts=texts))
+    response.raise_for_status()
+    return response.json()["results"]
+
+
+def nerWithWorker(sentence, url=worker_url):
+    return requestWorker(url, "ner", [sentence])[0]
+
+
+def translateWithWorker(sentence, targetLang, sourceLang='en', url=worker_url):
+    return requestWorker(url, "translate", [sentence], src_lang=sourceLang, tgt_lang=targetLang)[0]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve the NER and M2M100 pipelines from one warm process.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8811)
+    parser.add_argument("--max-batch", type=int, default=16)
+    parser.add_argument("--max-wait-ms", type=float, default=10.0)
+    parser.add_argument("--lazy", action="store_true", help="load each model on its first request")
+    args = parser.parse_args()
+
+    if not args.lazy:
+        import semevalTask2
+        semevalTask2.getNerPipe()
+        semevalTask2.getM2M()
+
+    batcher = MicroBatcher(runModelBatch, max_batch=args.max_batch, max_wait=args.max_wait_ms / 1000.0)
+    server = WorkerServer((args.host, args.port), batcher)
+    print(f"inference worker listening on http://{args.host}:{args.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,141 @@
+import argparse
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+# Persistent cache of named-entity extraction results. The English sources are
+# partly the same in the ten reference files of a split, so with one cache
+# file shared by every locale run, script and shard process each unique
+# sentence goes through an extractor once. Entries are content addressed by
+# sha256 of (extractor, version, sentence): a new model or prompt gets a new
+# version and simply stops hitting the old entries, which age out. The file
+# keeps at most maxEntries entries, evicting the least recently used on every
+# insert. SQLite's locking makes it safe to share between the processes of one
+# machine; keep the file on local disk, as WAL mode and SQLite locking do not
+# work on network filesystems (NFS, SMB).
+
+openCaches = {}
+openLock = threading.Lock()
+
+
+def cacheKey(extractor, version, sentence):
+    return hashlib.sha256(json.dumps([extractor, version, sentence], ensure_ascii=False).encode('utf-8')).hexdigest()
+
+
+class NeCache:
+    def __init__(self, path, maxEntries=200000, trim=True):
+        self.path = path
+        self.maxEntries = maxEntries
+        self.hits = 0
+        self.misses = 0
+        self.statsLock = threading.Lock()
+        # sqlite3 connections belong to the thread that opened them.
+        self.local = threading.local()
+        db = self.connect()
+        db.execute("CREATE TABLE IF NOT EXISTS entries (key TEXT PRIMARY KEY, extractor TEXT, result TEXT, used REAL)")
+        db.execute("CREATE INDEX IF NOT EXISTS entries_used ON entries (used)")
+        db.commit()
+        # A file written with a larger limit is trimmed on open.
+        if trim:
+            self.evict()
+
+    def connect(self):
+        db = getattr(self.local, "db", None)
+        if db is None:
+            db = sqlite3.connect(self.path, timeout=30)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("PRAGMA synchronous=NORMAL")
+            self.local.db = db
+        return db
+
+    def get(self, extractor, version, sentence):
+        # (True, result) on a hit, (False, None) on a miss.
+        db = self.connect()
+        key = cacheKey(extractor, version, sentence)
+        row = db.execute("SELECT result FROM entries WHERE key = ?", (key,)).fetchone()
+        with self.statsLock:
+            if row is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        if row is None:
+            return False, None
+        db.execute("UPDATE entries SET used = ? WHERE key = ?", (time.time(), key))
+        db.commit()
+        return True, json.loads(row[0])
+
+    def put(self, extractor, version, sentence, result):
+        db = self.connect()
+        db.execute("INSERT OR REPLACE INTO entries (key, extractor, result, used) VALUES (?, ?, ?, ?)",
+                   (cacheKey(extractor, version, sentence), extractor, json.dumps(result, ensure_ascii=False),
+                    time.time()))
+        self.evict(commit=False)
+        db.commit()
+
+    def cached(self, extractor, version, sentence, extract):
+        # Failed extractions (None) are not stored, so they are retried next time.
+        found, result = self.get(extractor, version, sentence)
+        if found:
+            return result
+        result = extract(sentence)
+        if result is not None:
+            self.put(extractor, version, sentence, result)
+        return result
+
+    def evict(self, commit=True):
+        db = self.connect()
+        excess = len(self) - self.maxEntries
+        if excess > 0:
+            db.execute("DELETE FROM entries WHERE key IN (SELECT key FROM entries ORDER BY used LIMIT ?)", (excess,))
+        if commit:
+            db.commit()
+
+    def __len__(self):
+        return self.connect().execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "entries": len(self),
+        }
+
+    def report(self):
+        stats = self.stats()
+        print(f"NE cache {self.path}: {stats['hits']} hits, {stats['misses']} misses "
+              f"({100. * stats['hit_rate']:.1f}% hit rate), {stats['entries']} entries")
+        return stats
+
+
+def openNeCache(path, maxEntries=200000):
+    # One instance per file and process, so the counters cover the whole run.
+    with openLock:
+        if path not in openCaches:
+            openCaches[path] = NeCache(path, maxEntries)
+        return openCaches[path]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Inspect or trim an NE extraction cache.")
+    parser.add_argument("path")
+    parser.add_argument("--max-entries", type=int, help="evict down to this many entries")
+    args = parser.parse_args()
+
+    if not os.path.exists(args.path):
+        parser.error(f"{args.path} does not exist")
+    # Only trimmed when a limit is given; inspecting leaves the file as it is.
+    cache = NeCache(args.path, args.max_entries, trim=False)
+    if args.max_entries is not None:
+        cache.evict()
+    for extractor, count in cache.connect().execute("SELECT extractor, COUNT(*) FROM entries GROUP BY extractor"):
+        print(f"{extractor}: {count} entries")
+    print(f"{len(cache)} entries, {os.path.getsize(args.path)} bytes")
+
+
+if __name__ == "__main__":
+    main()
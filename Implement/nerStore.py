@@ -0,0 +1,248 @@
+import argparse
+import json
+import mmap
+import os
+import re
+import struct
+import sys
+import time
+from array import array
+
+# Compact on-disk form of the NER dictionary JSONL ({"ne": ..., "<locale>": ...}
+# per line). Every string is stored once in a string pool, the entity names are
+# kept sorted for binary search and every locale is a column of string ids, so
+# opening the file is an mmap and a lookup only touches the pages it needs:
+#
+#   header   magic, version, counts and section offsets
+#   locales  JSON list of locale names
+#   strings  uint32 offsets (nStrings + 1) followed by the UTF-8 data
+#   keys     uint32 string ids of the entity names, sorted by their UTF-8 bytes
+#   columns  one uint32 string id per key and locale, MISSING when absent
+
+MAGIC = b"NERS"
+VERSION = 1
+MISSING = 0xFFFFFFFF
+headerFormat = "<4sIIIII6Q"
+wordPattern = re.compile(r"\w+")
+
+
+def maxWordCount(name):
+    return len(wordPattern.findall(name))
+
+
+def edgePositions(sentence, pos, step):
+    # pos followed by the positions reached by moving it over the punctuation
+    # (neither word characters nor spaces) next to it, away from the word.
+    positions = [pos]
+    offset = -1 if step < 0 else 0
+    while 0 <= pos + offset < len(sentence):
+        char = sentence[pos + offset]
+        if char.isspace() or wordPattern.match(char):
+            break
+        pos += step
+        positions.append(pos)
+    return positions
+
+
+def compileNerDict(jsonlPath, storePath):
+    strings = {}
+
+    def intern(text):
+        if text not in strings:
+            strings[text] = len(strings)
+        return strings[text]
+
+    records = {}
+    locales = []
+    with open(jsonlPath, 'r', encoding='utf-8') as file:
+        for line in file:
+            line = line.strip()
+            if not line:
+                continue
+            data = json.loads(line)
+            key = data.get('ne')
+            if not key:
+                continue
+            labels = records.setdefault(key, {})
+            for locale, label in data.items():
+                if locale == 'ne' or not isinstance(label, str):
+                    continue
+                if locale not in locales:
+                    locales.append(locale)
+                labels[locale] = intern(label)
+
+    keys = sorted(records, key=lambda k: k.encode('utf-8'))
+    keyIds = array('I', (intern(key) for key in keys))
+    columns = []
+    for locale in locales:
+        columns.append(array('I', (records[key].get(locale, MISSING) for key in keys)))
+    maxWords = max((maxWordCount(key) for key in keys), default=0)
+
+    data = bytearray()
+    offsets = array('I', [0])
+    for text in strings:
+        data += text.encode('utf-8')
+        offsets.append(len(data))
+
+    localeBlob = json.dumps(locales, ensure_ascii=False).encode('utf-8')
+    pad = lambda n: (-n) % 8
+    localesOffset = struct.calcsize(headerFormat)
+    offsetsOffset = localesOffset + len(localeBlob) + pad(localesOffset + len(localeBlob))
+    dataOffset = offsetsOffset + len(offsets) * 4
+    keysOffset = dataOffset + len(data) + pad(dataOffset + len(data))
+    columnsOffset = keysOffset + len(keyIds) * 4
+    header = struct.pack(headerFormat, MAGIC, VERSION, len(keys), len(locales), len(strings), maxWords,
+                         localesOffset, len(localeBlob), offsetsOffset, dataOffset, keysOffset, columnsOffset)
+
+    # Written next to the target and renamed, so concurrent runs never see a partial file.
+    tmpPath = f"{storePath}.{os.getpid()}.tmp"
+    with open(tmpPath, 'wb') as f:
+        for section, offset in ((header, 0), (localeBlob, localesOffset), (offsets, offsetsOffset),
+                                (data, dataOffset), (keyIds, keysOffset)):
+            f.write(b"\0" * (offset - f.tell()))
+            f.write(section)
+        f.write(b"\0" * (columnsOffset - f.tell()))
+        for column in columns:
+            f.write(column)
+    os.replace(tmpPath, storePath)
+    return storePath
+
+
+class NerStore:
+    def __init__(self, path):
+        if sys.byteorder != "little":
+            raise ValueError("NerStore files are little-endian")
+        self.file = open(path, 'rb')
+        self.mm = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        (magic, version, self.nKeys, nLocales, nStrings, self.maxWords, localesOffset, localesLength,
+         offsetsOffset, self.dataOffset, keysOffset, columnsOffset) = struct.unpack_from(headerFormat, self.mm)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"{path} is not a version {VERSION} NER store")
+        self.locales = json.loads(self.mm[localesOffset:localesOffset + localesLength])
+        self.view = view = memoryview(self.mm)
+        self.offsets = view[offsetsOffset:offsetsOffset + (nStrings + 1) * 4].cast('I')
+        self.keyIds = view[keysOffset:keysOffset + self.nKeys * 4].cast('I')
+        self.columns = {}
+        for idx, locale in enumerate(self.locales):
+            start = columnsOffset + idx * self.nKeys * 4
+            self.columns[locale] = view[start:start + self.nKeys * 4].cast('I')
+
+    def __len__(self):
+        return self.nKeys
+
+    def __contains__(self, ne):
+        return self.find(ne) is not None
+
+    def close(self):
+        self.offsets.release()
+        self.keyIds.release()
+        for column in self.columns.values():
+            column.release()
+        self.view.release()
+        self.mm.close()
+        self.file.close()
+
+    def stringBytes(self, stringId):
+        start = self.dataOffset + self.offsets[stringId]
+        end = self.dataOffset + self.offsets[stringId + 1]
+        return self.mm[start:end]
+
+    def find(self, ne):
+        target = ne.encode('utf-8')
+        lo, hi = 0, self.nKeys
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self.stringBytes(self.keyIds[mid]) < target:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo < self.nKeys and self.stringBytes(self.keyIds[lo]) == target:
+            return lo
+        return None
+
+    def columnFor(self, locale):
+        # Accept both "tr" and "tr_TR" whichever form the dictionary uses.
+        if locale in self.columns:
+            return self.columns[locale]
+        short = locale.split("_")[0]
+        for name, column in self.columns.items():
+            if name.split("_")[0] == short:
+                return column
+        return None
+
+    def get(self, ne, locale, default=None):
+        idx = self.find(ne)
+        column = self.columnFor(locale)
+        if idx is None or column is None or column[idx] == MISSING:
+            return default
+        return self.stringBytes(column[idx]).decode('utf-8')
+
+    def keys(self):
+        for idx in range(self.nKeys):
+            yield self.stringBytes(self.keyIds[idx]).decode('utf-8')
+
+    def findIn(self, sentence, locale):
+        # Entities occurring in the sentence that have a label for locale, longest
+        # first. Candidates are the runs of up to maxWords words of the sentence,
+        # so the cost depends on the sentence, not on the size of the dictionary.
+        # Their edges may also take in the punctuation touching the first and last
+        # word, for names like "(500) Days of Summer" or "Tick, Tick... Boom!".
+        column = self.columnFor(locale)
+        if column is None:
+            return []
+        spans = [match.span() for match in wordPattern.finditer(sentence)]
+        starts = [edgePositions(sentence, start, -1) for start, end in spans]
+        ends = [edgePositions(sentence, end, 1) for start, end in spans]
+        found = {}
+        for i in range(len(spans)):
+            for j in range(i, min(len(spans), i + self.maxWords)):
+                for start in starts[i]:
+                    for end in ends[j]:
+                        candidate = sentence[start:end]
+                        if candidate in found:
+                            continue
+                        idx = self.find(candidate)
+                        if idx is not None and column[idx] != MISSING:
+                            found[candidate] = self.stringBytes(column[idx]).decode('utf-8')
+        return sorted(found.items(), key=lambda item: len(item[0]), reverse=True)
+
+
+def openNerDict(jsonlPath, storePath=None):
+    # Compiles the JSONL on first use (and whenever it is newer than the store).
+    storePath = storePath or f"{jsonlPath}.nerstore"
+    if not os.path.exists(storePath) or os.path.getmtime(storePath) < os.path.getmtime(jsonlPath):
+        compileNerDict(jsonlPath, storePath)
+    return NerStore(storePath)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compile and query the NER dictionary store.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    comp = sub.add_parser("compile")
+    comp.add_argument("jsonl")
+    comp.add_argument("store", nargs="?")
+    look = sub.add_parser("lookup")
+    look.add_argument("store")
+    look.add_argument("locale")
+    look.add_argument("text", help="entity name, or a sentence with --sentence")
+    look.add_argument("--sentence", action="store_true")
+    args = parser.parse_args()
+
+    if args.command == "compile":
+        start = time.perf_counter()
+        path = compileNerDict(args.jsonl, args.store or f"{args.jsonl}.nerstore")
+        print(f"{path}: {os.path.getsize(path)} bytes in {time.perf_counter() - start:.2f}s")
+        return
+
+    start = time.perf_counter()
+    store = NerStore(args.store)
+    opened = time.perf_counter() - start
+    if args.sentence:
+        print(store.findIn(args.text, args.locale))
+    else:
+        print(store.get(args.text, args.locale))
+    print(f"opened {len(store)} entities in {1000 * opened:.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+import re
+import threading
+
+# Entity protection by placeholders: every resolved entity in the source sentence
+# is replaced by a token NE0, NE1, ... in one regex pass before translation, and
+# the tokens in the output are swapped for the target-language labels in one
+# linear scan afterwards. Longer entities win over entities they contain, so
+# overlapping names no longer clobber each other the way repeated str.replace did.
+#
+# placeholderStats counts, per backend, how many placeholders were sent and how
+# many came back intact, which tells whether a backend can be used in this mode.
+
+restorePattern = re.compile(r"(?<![A-Za-z])N\s?E\s?(\d+)(?!\d)")
+
+placeholderStats = {}
+statsLock = threading.Lock()
+
+
+def protect(sentence, pairs):
+    # pairs: (text as it appears in the sentence, translation); the first pair
+    # for a given text wins.
+    translations = {}
+    for surface, translation in pairs:
+        if surface and translation and surface not in translations:
+            translations[surface] = translation
+    if not translations:
+        return sentence, {}
+
+    pattern = re.compile("|".join(re.escape(surface) for surface in sorted(translations, key=len, reverse=True)))
+    tokens = {}
+    mapping = {}
+
+    def replace(match):
+        surface = match.group(0)
+        if surface not in tokens:
+            tokens[surface] = f"NE{len(tokens)}"
+            mapping[tokens[surface]] = translations[surface]
+        return tokens[surface]
+
+    return pattern.sub(replace, sentence), mapping
+
+
+def restore(translation, mapping, backend):
+    if not mapping:
+        return translation
+    found = set()
+
+    def replace(match):
+        token = f"NE{match.group(1)}"
+        if token not in mapping:
+            return match.group(0)
+        found.add(token)
+        return mapping[token]
+
+    restored = restorePattern.sub(replace, translation)
+    with statsLock:
+        stats = placeholderStats.setdefault(backend, {"sentences": 0, "placeholders": 0, "survived": 0})
+        stats["sentences"] += 1
+        stats["placeholders"] += len(mapping)
+        stats["survived"] += len(found)
+    return restored
+
+
+def placeholderReport():
+    for backend, stats in sorted(placeholderStats.items()):
+        rate = stats["survived"] / stats["placeholders"] if stats["placeholders"] else 0.0
+        print(f"{backend}: {stats['survived']}/{stats['placeholders']} placeholders survived "
+              f"({100. * rate:.1f}%) over {stats['sentences']} sentences")
+    return placeholderStats
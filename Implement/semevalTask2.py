@@ -1,26 +1,30 @@
-import openai
-openai.api_key="your api_key"
-from openai import OpenAI
 import os.path
 import ast
-from transformers import pipeline
 import json
 import requests
-from bs4 import BeautifulSoup
 import re
 import time
 import random
-from fuzzywuzzy import fuzz
 
 
 langList = ['ar_AE','de_DE','fr_FR','es_ES','it_IT','ko_KR','th_TH','tr_TR','zh_TW',"ja_JP"]
 lang = "fr_FR"
 
- pipe = pipeline("token-classification", model="dslim/bert-large-NER")
- m2m =  pipeline("text2text-generation", model="facebook/m2m100_418M")
+# The local models and the API client are only created by the code paths that
+# use them, so e.g. a QwenMT run never loads the NER or M2M100 weights.
+pipe = None
+m2m = None
+client = None
+# Set to the address of a running inferenceWorker.py to use its warm, batched
+# models instead of loading them in this process.
+worker_url = None
 
 api_url = 'your api_url'
 api_key_QwenMax = 'your api_key'
+wikidata_url = "https://www.wikidata.org"
+# When set, a failed Wikidata request raises instead of reading as "no
+# translation", so a caller can tell a flaky lookup from a missing label.
+raise_lookup_errors = False
 
 CountryDict={
     "ar_AE":"ar",
@@ -50,6 +54,71 @@ CountryDict2 = {
 
 cache = {}
 
+# main() overlaps extraction, lookups and translation of consecutive sentences
+# when pipelined is set; stage_workers is the number of threads per stage.
+pipelined = True
+stage_workers = {"extract": 4, "lookup": 8, "substitute": 1, "translate": 4}
+stage_queue_size = 32
+# Replace resolved entities by placeholders before translation and put the
+# target-language labels back afterwards, instead of substituting the labels
+# into the English sentence (see placeholders.py).
+protect_entities = False
+# Path of an neCache.py database shared by every run: entities extracted from
+# a source sentence are reused by the other locales and scripts. Bump an
+# extractor version when its model, prompt or post-processing changes.
+ne_cache_path = None
+ne_cache_size = 200000
+ner_extractor_version = "1"
+qwen_extractor_version = "1"
+
+
+def getNerPipe():
+    global pipe
+    if pipe is None:
+        from transformers import pipeline
+        pipe = pipeline("token-classification", model="dslim/bert-large-NER")
+    return pipe
+
+
+def getM2M():
+    global m2m
+    if m2m is None:
+        from transformers import pipeline
+        m2m = pipeline("text2text-generation", model="facebook/m2m100_418M")
+    return m2m
+
+
+def runNer(sentence):
+    if worker_url:
+        from inferenceWorker import nerWithWorker
+        return nerWithWorker(sentence, url=worker_url)
+    return getNerPipe()(sentence)
+
+
+def getNeCache():
+    if not ne_cache_path:
+        return None
+    from neCache import openNeCache
+    return openNeCache(ne_cache_path, int(ne_cache_size))
+
+
+def cachedExtraction(extractor, version, sentence, extract):
+    neCache = getNeCache()
+    if neCache is None:
+        return extract(sentence)
+    return neCache.cached(extractor, version, sentence, extract)
+
+
+def getClient():
+    global client
+    if client is None:
+        from openai import OpenAI
+        client = OpenAI(
+            api_key=api_key_QwenMax,
+            base_url=api_url,
+        )
+    return client
+
 
 def clean_translated_name(translated_name):
     """
@@ -73,7 +142,8 @@ def clean_translated_name(translated_name):
     return cleaned_name
 
 def translate_with_slidingWindow(ne,translated_sentence,translated_name):
-    
+    from fuzzywuzzy import fuzz
+
     lne = len(ne)
     max_similarity = 0
     best_start = 0
@@ -103,55 +173,87 @@ def translate_with_slidingWindow(ne,translated_sentence,translated_name):
     return translated_sentence
 
 
-def crawl(sentence,targetLang):
-    ner_result = pipe(sentence)
-    
-    translated_sentence = sentence
+# The m2m and QwenMT paths are split into stages that pass a payload dict along:
+# sentence/targetLang -> entities -> lookups -> switched -> translation. The
+# sentence-at-a-time functions below chain them directly, while
+# translate_sentences_pipelined runs them as overlapping stages.
+
+def extract_ne_with_ner(sentence):
+    ner_result = runNer(sentence)
     try:
         entityList = merge_entities(ner_result)
-    
     except Exception as e:
-        return translated_sentence
+        entityList = []
+    return [entity["entity"] for entity in entityList]
 
-    
-    for entity in entityList:
-        entity_name = entity["entity"]
-        label = entity["label"]
 
+def extract_entities_with_ner(payload):
+    payload["entities"] = cachedExtraction("dslim/bert-large-NER", ner_extractor_version, payload["sentence"],
+                                           extract_ne_with_ner)
+    return payload
+
+
+def lookup_entities_for_m2m(payload):
+    lookups = []
+    for entity_name in payload["entities"]:
         # Wizard ' s  First Rule
         entity_name = re.sub(r'\s([.,;!?()[]{}])', r'\1', entity_name)
         entity_name = re.sub(r'([.,;!?()[]{}])\s', r'\1', entity_name)
 
-      
-       
-        ne,translated_name = query_wikidata_translation(entity_name, targetLang)
+        ne,translated_name = query_wikidata_translation(entity_name, payload["targetLang"])
 
-        
-        if translated_name is None:
-            return translated_sentence
-        if ne is None:
-            return  translated_sentence
-        if ne== "":
-            return translated_sentence
-        if translated_name == "":
-            return translated_sentence
-       
-        elif entity_name in translated_name:
-            return translated_sentence
+        # Stop at the first entity without a usable translation and keep the
+        # ones resolved so far.
+        if not translated_name or not ne:
+            break
+        if entity_name in translated_name:
+            break
+        lookups.append({"entity": entity_name, "ne": clean_translated_name(ne), "translation": translated_name})
+    payload["lookups"] = lookups
+    return payload
 
-        if translated_name:
-           
-            ne = clean_translated_name(ne)
 
-           
-            translated_sentence = translate_with_slidingWindow(ne,translated_sentence,translated_name)
+def substitute_entities_for_m2m(payload):
+    if protect_entities:
+        from placeholders import protect
+        # The NER text is what occurs in the sentence; the Wikidata label is
+        # tried too for entities the tokenizer split differently.
+        pairs = [(lookup["entity"], lookup["translation"]) for lookup in payload["lookups"]]
+        pairs += [(lookup["ne"], lookup["translation"]) for lookup in payload["lookups"]]
+        payload["switched"], payload["placeholders"] = protect(payload["sentence"], pairs)
+        return payload
+    translated_sentence = payload["sentence"]
+    for lookup in payload["lookups"]:
+        translated_sentence = translate_with_slidingWindow(lookup["ne"],translated_sentence,lookup["translation"])
+    payload["switched"] = translated_sentence
+    return payload
 
-    return translated_sentence
+
+def translate_switched_with_m2m(payload):
+    translation = translate_with_m2m(payload["switched"], payload["targetLang"], payload.get("sourceLang", 'en'))
+    payload["translation"] = restore_entities(payload, translation, "m2m")
+    return payload
+
+
+def restore_entities(payload, translation, backend):
+    if not payload.get("placeholders"):
+        return translation
+    from placeholders import restore
+    return restore(translation, payload["placeholders"], backend)
+
+
+def crawl(sentence,targetLang):
+    payload = {"sentence": sentence, "targetLang": targetLang}
+    for stage in (extract_entities_with_ner, lookup_entities_for_m2m, substitute_entities_for_m2m):
+        payload = stage(payload)
+    return payload["switched"]
 
 
 def query_wikidata_translation(entity_name, target_lang):
-   
-    search_url = f"https://www.wikidata.org/w/index.php?search={entity_name}&ns0=1"
+    from bs4 import BeautifulSoup
+    from fuzzywuzzy import fuzz
+
+    search_url = f"{wikidata_url}/w/index.php?search={entity_name}&ns0=1"
     headers = {
         "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/132.0.0.0 Safari/537.36",
         "Accept-Language": target_lang,
@@ -159,6 +261,8 @@ def query_wikidata_translation(entity_name, target_lang):
 
     response = requests.get(search_url, headers=headers)
     if response.status_code != 200:
+        if raise_lookup_errors:
+            raise LookupError(f"Wikidata search for {entity_name} returned HTTP {response.status_code}")
         print(f"Failed to search {entity_name} on Wikidata.")
         return None,None
 
@@ -207,12 +311,14 @@ def query_wikidata_translation(entity_name, target_lang):
         print(f"No results found for {entity_name}.")
         return None,None
 
-    entity_url = "https://www.wikidata.org" + link["href"]+f"?uselang={target_lang}"
+    entity_url = wikidata_url + link["href"]+f"?uselang={target_lang}"
 
     
     response = requests.get(entity_url, headers=headers)
 
     if response.status_code != 200:
+        if raise_lookup_errors:
+            raise LookupError(f"Wikidata entity page for {entity_name} returned HTTP {response.status_code}")
         print(f"Failed to access the entity page for {entity_name}.")
         return None,None
 
@@ -266,51 +372,85 @@ def generateSubmitFile():
             output_file.write('\n')
 
 
-def translate_sentence_with_m2m(sentence,targetLang,sourceLang='en'):
-   
-    swithSentence = crawl(sentence, targetLang=targetLang)
+def translate_with_m2m(sentence,targetLang,sourceLang='en'):
+    if worker_url:
+        from inferenceWorker import translateWithWorker
+        return translateWithWorker(sentence, targetLang, sourceLang, url=worker_url)
+    m2m = getM2M()
     m2m.tokenizer.src_lang = sourceLang
     
     m2m.generation_config.forced_bos_token_id = m2m.tokenizer.get_lang_id(targetLang)
-    translation = m2m(swithSentence)
+    translation = m2m(sentence)
     return translation[0]['generated_text']
 
 
+def translate_payload_with_m2m(sentence,targetLang,sourceLang='en'):
+    payload = {"sentence": sentence, "targetLang": targetLang, "sourceLang": sourceLang}
+    for stage in (extract_entities_with_ner, lookup_entities_for_m2m, substitute_entities_for_m2m,
+                  translate_switched_with_m2m):
+        payload = stage(payload)
+    return payload
 
-def switch_ne_with_Qwen(sentence,neList,targetLang):
-    
-    translated_sentence = sentence
-    for ne in neList:
-       
-        if ne in cache:
-            translated_sentence = translated_sentence.replace(ne,cache[ne])
-        else:
-            entity_name = re.sub(r'\s([.,;!?()[]{}])', r'\1', ne)
-            entity_name = re.sub(r'([.,;!?()[]{}])\s', r'\1', entity_name)
-        
-        
-            _, translated_name = query_wikidata_translation(entity_name, targetLang)
 
-           
-            if translated_name is None:
-                continue
-            if translated_name == "":
-                continue
-            
-            if entity_name in translated_name:
-                continue
-            cache[ne] = translated_name
-            translated_sentence = translated_sentence.replace(ne,translated_name)
-    return translated_sentence
+def translate_sentence_with_m2m(sentence,targetLang,sourceLang='en'):
+    return translate_payload_with_m2m(sentence, targetLang, sourceLang)["translation"]
+
+
+def extract_entities_with_QwenMax(payload):
+    payload["entities"] = extract_ne_with_QwenMax(payload["sentence"])
+    return payload
+
+
+def lookup_entities_for_Qwen(payload):
+    lookups = []
+    for ne in payload["entities"] or []:
+        entity_name = re.sub(r'\s([.,;!?()[]{}])', r'\1', ne)
+        entity_name = re.sub(r'([.,;!?()[]{}])\s', r'\1', entity_name)
+        if (ne, payload["targetLang"]) in cache:
+            lookups.append({"entity": entity_name, "ne": ne, "translation": cache[(ne, payload["targetLang"])]})
+            continue
+
+        _, translated_name = query_wikidata_translation(entity_name, payload["targetLang"])
+
+        if not translated_name:
+            continue
+        if entity_name in translated_name:
+            continue
+        cache[(ne, payload["targetLang"])] = translated_name
+        lookups.append({"entity": entity_name, "ne": ne, "translation": translated_name})
+    payload["lookups"] = lookups
+    return payload
+
+
+def substitute_entities_for_Qwen(payload):
+    if protect_entities:
+        from placeholders import protect
+        pairs = [(lookup["ne"], lookup["translation"]) for lookup in payload["lookups"]]
+        payload["switched"], payload["placeholders"] = protect(payload["sentence"], pairs)
+        return payload
+    translated_sentence = payload["sentence"]
+    for lookup in payload["lookups"]:
+        translated_sentence = translated_sentence.replace(lookup["ne"],lookup["translation"])
+    payload["switched"] = translated_sentence
+    return payload
+
+
+def translate_switched_with_QwenMT(payload):
+    payload["translation"] = restore_entities(payload, translate_with_QwenMT(payload["switched"]), "QwenMT")
+    return payload
+
+
+def switch_ne_with_Qwen(sentence,neList,targetLang):
+    payload = {"sentence": sentence, "targetLang": targetLang, "entities": neList}
+    return substitute_entities_for_Qwen(lookup_entities_for_Qwen(payload))["switched"]
 
 def extract_ne_with_QwenMax(sentence):
-    client = OpenAI(
-        
-        api_key=api_key_QwenMax,
-        base_url=api_url,
-    )
-    completion = client.chat.completions.create(
-       
+    return cachedExtraction("qwen-max", qwen_extractor_version, sentence, query_ne_with_QwenMax)
+
+
+def query_ne_with_QwenMax(sentence):
+    completion = getClient().chat.completions.create(
+        model="qwen-max",
         messages=[
             {'role': 'system', 'content': 'You are a helpful assistant that extracts named entities from text. Always return the named entities in a Python list format, such as ["Entity1", "Entity2"]. If no entities are found, return an empty list [].'},
             {'role': 'user', 'content': sentence}
@@ -325,16 +465,7 @@ def extract_ne_with_QwenMax(sentence):
     return response
 
 
-def translate_sentence_with_QwenMT(sentence, targetLang):
-    neList = extract_ne_with_QwenMax(sentence)
-
-
-    if neList is None:
-       switchSentence = sentence
-    else:
-        switchSentence = switch_ne_with_Qwen(sentence,neList,targetLang=targetLang)
-
-    
+def translate_with_QwenMT(switchSentence):
     messages = [
         {
             "role": "user",
@@ -345,8 +476,8 @@ def translate_sentence_with_QwenMT(sentence, targetLang):
         "source_lang": "English",
         "target_lang": f"{CountryDict[lang]}",
     }
-    completion = client.chat.completions.create(
-        
+    completion = getClient().chat.completions.create(
+        model="qwen-mt-turbo",
         messages=messages,
         extra_body={
             "translation_options": translation_options
@@ -355,6 +486,43 @@ def translate_sentence_with_QwenMT(sentence, targetLang):
     return completion.choices[0].message.content
 
 
+def translate_payload_with_QwenMT(sentence, targetLang):
+    payload = {"sentence": sentence, "targetLang": targetLang}
+    for stage in (extract_entities_with_QwenMax, lookup_entities_for_Qwen, substitute_entities_for_Qwen,
+                  translate_switched_with_QwenMT):
+        payload = stage(payload)
+    return payload
+
+
+def translate_sentence_with_QwenMT(sentence, targetLang):
+    return translate_payload_with_QwenMT(sentence, targetLang)["translation"]
+
+
+def stages_for(backend):
+    # Network-bound stages get several workers; the local models run on one
+    # worker each unless they are served by the inference worker.
+    if backend == "m2m":
+        localWorkers = stage_workers["translate"] if worker_url else 1
+        return [
+            (extract_entities_with_ner, stage_workers["extract"] if worker_url else 1),
+            (lookup_entities_for_m2m, stage_workers["lookup"]),
+            (substitute_entities_for_m2m, stage_workers["substitute"]),
+            (translate_switched_with_m2m, localWorkers),
+        ]
+    return [
+        (extract_entities_with_QwenMax, stage_workers["extract"]),
+        (lookup_entities_for_Qwen, stage_workers["lookup"]),
+        (substitute_entities_for_Qwen, stage_workers["substitute"]),
+        (translate_switched_with_QwenMT, stage_workers["translate"]),
+    ]
+
+
+def translate_sentences_pipelined(sentences, targetLang, backend="QwenMT"):
+    from stageRunner import runStages
+    payloads = ({"sentence": sentence, "targetLang": targetLang} for sentence in sentences)
+    return runStages(payloads, stages_for(backend), maxQueue=stage_queue_size)
+
+
 def extract_sentences(field='source'):
     data = getSourceFile()
     return [entry[field] for entry in data]
@@ -415,23 +583,36 @@ def main():
     targetLang = extract_lang()[0]
 
 
-    cnt = 0
-    for sentence in sentences:
-        try:
-           
-            translated = translate_sentence_with_QwenMT(sentence, targetLang)
-          
-
-            translated_sentences.append(translated)
-           
-            cnt+=1
-        except Exception as e:
-            print(f"{e}")
+    if pipelined:
+        for payload, error in translate_sentences_pipelined(sentences, targetLang):
+            if error is not None:
+                print(f"{error}")
+                continue
+            translated_sentences.append(payload["translation"])
+    else:
+        cnt = 0
+        for sentence in sentences:
+            try:
+               
+                translated = translate_sentence_with_QwenMT(sentence, targetLang)
+              
+
+                translated_sentences.append(translated)
+               
+                cnt+=1
+            except Exception as e:
+                print(f"{e}")
+
+    if protect_entities:
+        from placeholders import placeholderReport
+        placeholderReport()
+    if ne_cache_path:
+        getNeCache().report()
 
     # 将翻译后的句子写入txt文件
     write_to_txt(translated_sentences, output_file)
     print(f"{output_file}")
 
 if __name__=="__main__":
-     main()
+    main()
     generateSubmitFile()
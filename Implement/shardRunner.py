@@ -0,0 +1,256 @@
+import argparse
+import glob
+import json
+import os
+import socket
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from backends import BACKENDS, langList, predictionsPath, readReferences, getTranslator, loadScript, parseOverrides, submissionRecord
+
+# Runs a whole submission as (locale, shard) units instead of one script run per
+# locale. Units either go to a local process pool, or into a work queue directory
+# on shared storage where any number of machines can claim them:
+#
+#   python shardRunner.py run --backend qwenmt --split test --workers 10 --work-dir /tmp/shards --system QwenAPI
+#   python shardRunner.py enqueue --queue-dir /shared/q --backend qwenmt --split test
+#   python shardRunner.py work --queue-dir /shared/q          (on every machine)
+#   python shardRunner.py merge --queue-dir /shared/q --system QwenAPI --split test
+#
+# A queue directory holds todo/, claimed/, done/ and failed/ unit files plus out/
+# with one JSONL per shard; a unit is claimed by renaming it out of todo/, which
+# only one worker can do. Merged files go to data/predictions/{system}/{split}/{locale}.jsonl.
+#
+# A shard is only written when every sentence of it was translated. A unit with
+# failures leaves no shard: `run` retries it when started again, and `work`
+# moves it to failed/, from where the next `work` puts it back in todo/.
+
+loadedModules = {}
+
+
+def makeUnits(split, locales, shardSize, backend, overrides):
+    units = []
+    for locale in locales:
+        count = len(readReferences(split, locale))
+        for shard, start in enumerate(range(0, count, shardSize)):
+            units.append({
+                "backend": backend,
+                "split": split,
+                "locale": locale,
+                "shard": shard,
+                "start": start,
+                "end": min(start + shardSize, count),
+                "overrides": overrides,
+            })
+    # Largest units first so the last ones to start are also the shortest.
+    units.sort(key=lambda unit: unit["end"] - unit["start"], reverse=True)
+    return units
+
+
+def unitName(unit):
+    return f"{unit['locale']}-{unit['shard']:04d}"
+
+
+def shardPath(outDir, unit):
+    return os.path.join(outDir, unit["locale"], f"shard-{unit['shard']:04d}.jsonl")
+
+
+def runUnit(unit, outDir):
+    path = shardPath(outDir, unit)
+    if os.path.exists(path):
+        return unit, 0
+    fileName = BACKENDS[unit["backend"]][0]
+    key = (fileName, json.dumps(unit["overrides"], sort_keys=True))
+    if key not in loadedModules:
+        loadedModules[key] = loadScript(fileName, **unit["overrides"])
+    translate = getTranslator(unit["backend"], unit["locale"], module=loadedModules[key])
+
+    records = []
+    failed = 0
+    for item in readReferences(unit["split"], unit["locale"])[unit["start"]:unit["end"]]:
+        try:
+            records.append(submissionRecord(item, translate(item["source"])))
+        except Exception as e:
+            failed += 1
+            print(f"{item['id']}: {e}")
+    if failed:
+        return unit, failed
+
+    # Write then rename, so a shard file only exists once it is complete.
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmpPath = f"{path}.{socket.gethostname()}-{os.getpid()}.tmp"
+    with open(tmpPath, 'w', encoding='utf-8') as f:
+        for record in records:
+            json.dump(record, f, ensure_ascii=False)
+            f.write('\n')
+    os.replace(tmpPath, path)
+    return unit, failed
+
+
+def runPool(units, outDir, workers):
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(runUnit, unit, outDir) for unit in units]
+        incomplete = 0
+        for future in as_completed(futures):
+            unit, failed = future.result()
+            if failed:
+                incomplete += 1
+                print(f"{unitName(unit)}: {failed} failed, not written")
+            else:
+                print(f"{unitName(unit)}: done")
+    if incomplete:
+        print(f"Warning: {incomplete} units had failures; run again to retry them")
+
+
+def enqueue(queueDir, units):
+    for sub in ("todo", "claimed", "done", "failed", "out"):
+        os.makedirs(os.path.join(queueDir, sub), exist_ok=True)
+    for unit in units:
+        path = os.path.join(queueDir, "todo", f"{unitName(unit)}.json")
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(unit, f, ensure_ascii=False)
+    print(f"Enqueued {len(units)} units in {queueDir}")
+
+
+def claim(queueDir):
+    # Units are enqueued largest first, so take the oldest file; losing the
+    # rename race to another worker just means trying the next one.
+    todo = glob.glob(os.path.join(queueDir, "todo", "*.json"))
+    todo.sort(key=lambda path: os.path.getmtime(path))
+    for path in todo:
+        claimedPath = os.path.join(queueDir, "claimed", os.path.basename(path))
+        try:
+            os.rename(path, claimedPath)
+        except OSError:
+            continue
+        os.utime(claimedPath)
+        return claimedPath
+    return None
+
+
+def requeueStale(queueDir, staleSeconds):
+    # Units claimed by a worker that died go back to todo/.
+    now = time.time()
+    for path in glob.glob(os.path.join(queueDir, "claimed", "*.json")):
+        try:
+            if now - os.path.getmtime(path) > staleSeconds:
+                os.rename(path, os.path.join(queueDir, "todo", os.path.basename(path)))
+                print(f"Requeued stale unit {os.path.basename(path)}")
+        except OSError:
+            continue
+
+
+def requeueFailed(queueDir):
+    # Units that failed in an earlier run get another try; within a run each
+    # unit is tried once, so a persistent failure cannot keep a worker busy.
+    os.makedirs(os.path.join(queueDir, "failed"), exist_ok=True)
+    for path in glob.glob(os.path.join(queueDir, "failed", "*.json")):
+        try:
+            os.rename(path, os.path.join(queueDir, "todo", os.path.basename(path)))
+        except OSError:
+            continue
+
+
+def work(queueDir, staleSeconds=None):
+    outDir = os.path.join(queueDir, "out")
+    requeueFailed(queueDir)
+    while True:
+        if staleSeconds:
+            requeueStale(queueDir, staleSeconds)
+        path = claim(queueDir)
+        if path is None:
+            break
+        with open(path, 'r', encoding='utf-8') as f:
+            unit = json.load(f)
+        unit, failed = runUnit(unit, outDir)
+        if failed:
+            os.rename(path, os.path.join(queueDir, "failed", os.path.basename(path)))
+            print(f"{unitName(unit)}: {failed} failed, moved to failed/")
+        else:
+            os.rename(path, os.path.join(queueDir, "done", os.path.basename(path)))
+            print(f"{unitName(unit)}: done")
+
+
+def pendingUnits(queueDir):
+    pending = {}
+    for sub in ("todo", "claimed", "failed"):
+        for path in glob.glob(os.path.join(queueDir, sub, "*.json")):
+            locale = os.path.basename(path).rsplit("-", 1)[0]
+            pending[locale] = pending.get(locale, 0) + 1
+    return pending
+
+
+def merge(outDir, split, locales, saveDir, pending=None):
+    os.makedirs(saveDir, exist_ok=True)
+    for locale in locales:
+        shards = sorted(glob.glob(os.path.join(outDir, locale, "shard-*.jsonl")))
+        if not shards:
+            continue
+        if pending and pending.get(locale):
+            print(f"Warning: {pending[locale]} units of {locale} are not finished yet")
+        savePath = os.path.join(saveDir, f"{locale}.jsonl")
+        ids = []
+        with open(savePath, 'w', encoding='utf-8') as output_file:
+            for shard in shards:
+                with open(shard, 'r', encoding='utf-8') as f:
+                    for line in f:
+                        output_file.write(line)
+                        ids.append(json.loads(line)["id"])
+        print(f"{savePath}: {len(ids)} predictions from {len(shards)} shards")
+        referenceIds = [item["id"] for item in readReferences(split, locale)]
+        missing = set(referenceIds) - set(ids)
+        if len(ids) != len(referenceIds) or missing:
+            print(f"Warning: {locale} has {len(ids)} predictions for {len(referenceIds)} references, "
+                  f"{len(missing)} references missing")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run a submission as (locale, shard) units.")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    def unitOptions(p):
+        p.add_argument("--backend", choices=list(BACKENDS), required=True)
+        p.add_argument("--split", default="test")
+        p.add_argument("--locales", nargs="+", default=langList)
+        p.add_argument("--shard-size", type=int, default=100)
+        p.add_argument("--set", action="append", metavar="NAME=VALUE",
+                       help="module global for the script, e.g. api_key_QwenMax=... or nerDict_path=...")
+
+    run = sub.add_parser("run", help="run all units in a local process pool and merge")
+    unitOptions(run)
+    run.add_argument("--workers", type=int, default=os.cpu_count())
+    run.add_argument("--work-dir", required=True, help="directory for the per-shard outputs")
+    run.add_argument("--system", required=True)
+
+    enq = sub.add_parser("enqueue", help="write the units to a shared queue directory")
+    unitOptions(enq)
+    enq.add_argument("--queue-dir", required=True)
+
+    wrk = sub.add_parser("work", help="claim and run units from a queue directory until it is empty")
+    wrk.add_argument("--queue-dir", required=True)
+    wrk.add_argument("--stale-seconds", type=float,
+                     help="requeue units claimed longer ago than this; should exceed the slowest unit")
+
+    mrg = sub.add_parser("merge", help="merge the per-shard outputs into per-locale submissions")
+    mrg.add_argument("--queue-dir", required=True)
+    mrg.add_argument("--split", default="test")
+    mrg.add_argument("--locales", nargs="+", default=langList)
+    mrg.add_argument("--system", required=True)
+    args = parser.parse_args()
+
+    if args.command == "run":
+        units = makeUnits(args.split, args.locales, args.shard_size, args.backend, parseOverrides(args.set))
+        runPool(units, args.work_dir, args.workers)
+        merge(args.work_dir, args.split, args.locales, os.path.join(predictionsPath, args.system, args.split))
+    elif args.command == "enqueue":
+        units = makeUnits(args.split, args.locales, args.shard_size, args.backend, parseOverrides(args.set))
+        enqueue(args.queue_dir, units)
+    elif args.command == "work":
+        work(args.queue_dir, args.stale_seconds)
+    else:
+        merge(os.path.join(args.queue_dir, "out"), args.split, args.locales,
+              os.path.join(predictionsPath, args.system, args.split), pendingUnits(args.queue_dir))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+import queue
+import threading
+
+# Streaming runner for per-sentence pipelines such as extraction -> lookup ->
+# substitution -> translation. Every stage has its own worker threads and the
+# stages are connected by bounded queues, so a slow stage blocks the ones before
+# it (backpressure) while the others keep working on the following sentences.
+# Results are yielded in input order as (result, error) pairs; an exception in
+# any stage is carried through to the output instead of stopping the run.
+#
+# At most maxInFlight items are between the input and the output at any time,
+# including the ones waiting in the reorder buffer, so one stalled sentence
+# holds back the input instead of letting everything behind it pile up.
+
+STOP = object()
+
+
+class StageError:
+    def __init__(self, error):
+        self.error = error
+
+
+def runStages(items, stages, maxQueue=32, maxInFlight=None):
+    # stages is a list of (function, workers); each function maps the value
+    # produced by the previous stage to the value for the next one.
+    queues = [queue.Queue(maxsize=maxQueue) for _ in range(len(stages) + 1)]
+    inFlight = threading.Semaphore(max(1, maxInFlight or maxQueue * (len(stages) + 1)))
+    # Set when the consumer stops early (the generator is closed): the input
+    # is no longer read and the stages pass the remaining items through.
+    closing = threading.Event()
+
+    def feed():
+        fed = 0
+        try:
+            iterator = iter(items)
+            while True:
+                inFlight.acquire()
+                if closing.is_set():
+                    break
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    break
+                queues[0].put((fed, item))
+                fed += 1
+        except Exception as e:
+            # A failing input ends the run like the end of the input, after
+            # handing the exception on to the output in its place.
+            queues[0].put((fed, StageError(e)))
+        finally:
+            for _ in range(stages[0][1]):
+                queues[0].put(STOP)
+
+    def work(stageIdx, fn, remaining, lock):
+        inbox = queues[stageIdx]
+        outbox = queues[stageIdx + 1]
+        while True:
+            task = inbox.get()
+            if task is STOP:
+                with lock:
+                    remaining[0] -= 1
+                    last = remaining[0] == 0
+                # The last worker of a stage to finish hands the stop on.
+                if last:
+                    nextWorkers = stages[stageIdx + 1][1] if stageIdx + 1 < len(stages) else 1
+                    for _ in range(nextWorkers):
+                        outbox.put(STOP)
+                return
+            idx, value = task
+            if not isinstance(value, StageError) and not closing.is_set():
+                try:
+                    value = fn(value)
+                except Exception as e:
+                    value = StageError(e)
+            outbox.put((idx, value))
+
+    def drain():
+        while queues[-1].get() is not STOP:
+            pass
+
+    threading.Thread(target=feed, daemon=True).start()
+    for stageIdx, (fn, workers) in enumerate(stages):
+        remaining = [workers]
+        lock = threading.Lock()
+        for _ in range(workers):
+            threading.Thread(target=work, args=(stageIdx, fn, remaining, lock), daemon=True).start()
+
+    # Reorder buffer: stages with several workers finish out of order.
+    done = {}
+    nextIdx = 0
+    finished = False
+    try:
+        while True:
+            task = queues[-1].get()
+            if task is STOP:
+                finished = True
+                break
+            idx, value = task
+            done[idx] = value
+            while nextIdx in done:
+                value = done.pop(nextIdx)
+                nextIdx += 1
+                inFlight.release()
+                if isinstance(value, StageError):
+                    yield None, value.error
+                else:
+                    yield value, None
+    finally:
+        if not finished:
+            # Closed early: wake the feeder so it stops, and keep emptying the
+            # output so the workers can hand on the stop and exit.
+            closing.set()
+            inFlight.release()
+            threading.Thread(target=drain, daemon=True).start()
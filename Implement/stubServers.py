@@ -0,0 +1,269 @@
+import argparse
+import json
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs, unquote_plus
+
+from backends import langList, readReferences
+
+# Local stand-ins for the services the pipelines call: the Wikidata search and
+# entity pages, an OpenAI compatible chat endpoint (also serving the DashScope
+# generation endpoint used by Tongyi) and the Ollama /api/generate endpoint.
+# Every stub sleeps for latency + uniform(0, jitter) seconds and fails with a
+# 503 for a fraction error_rate of the requests.
+
+connectorWords = {"of", "the", "and", "in", "on", "for", "de", "la", "du", "von", "&", "a", "an", "to"}
+
+
+def guessEntity(source):
+    # The references carry the target mentions but not the English one, so take
+    # the longest run of capitalised words (ignoring the question word).
+    words = source.rstrip("?.!").split()
+    best = []
+    current = []
+    for idx, word in enumerate(words):
+        if idx > 0 and (word[:1].isupper() or word[:1].isdigit()):
+            current.append(word)
+        elif current and word.lower() in connectorWords:
+            current.append(word)
+        else:
+            while current and current[-1].lower() in connectorWords:
+                current.pop()
+            if len(current) > len(best):
+                best = current
+            current = []
+    while current and current[-1].lower() in connectorWords:
+        current.pop()
+    if len(current) > len(best):
+        best = current
+    return " ".join(best)
+
+
+def buildFixtures(split="validation", locales=langList):
+    entities = {}
+    for locale in locales:
+        for item in readReferences(split, locale):
+            name = guessEntity(item["source"])
+            if not name or not item["targets"]:
+                continue
+            entity = entities.setdefault(name, {"id": item["wikidata_id"], "labels": {}})
+            entity["labels"].setdefault(item["target_locale"], item["targets"][0]["mention"])
+    return entities
+
+
+def writeNerDict(entities, path):
+    with open(path, 'w', encoding='utf-8') as f:
+        for name, entity in entities.items():
+            record = {"ne": name}
+            record.update(entity["labels"])
+            json.dump(record, f, ensure_ascii=False)
+            f.write('\n')
+
+
+class StubServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, handler, fixtures, latency=0.0, jitter=0.0, error_rate=0.0):
+        super().__init__(address, handler)
+        self.fixtures = fixtures
+        self.byLowerName = {name.lower(): name for name in fixtures}
+        self.byId = {entity["id"]: name for name, entity in fixtures.items()}
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.requests = 0
+        self.errors = 0
+        self.lock = threading.Lock()
+
+    def namesIn(self, text):
+        return [name for name in self.fixtures if name in text]
+
+    @property
+    def url(self):
+        return f"http://{self.server_address[0]}:{self.server_address[1]}"
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+    def simulate(self):
+        server = self.server
+        time.sleep(server.latency + random.uniform(0, server.jitter))
+        failed = random.random() < server.error_rate
+        with server.lock:
+            server.requests += 1
+            if failed:
+                server.errors += 1
+        if failed:
+            self.reply(503, "text/plain", "stub error")
+        return not failed
+
+    def reply(self, status, contentType, body):
+        if not isinstance(body, str):
+            body = json.dumps(body, ensure_ascii=False)
+        data = body.encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", f"{contentType}; charset=utf-8")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def readJson(self):
+        length = int(self.headers.get("Content-Length", 0))
+        return json.loads(self.rfile.read(length) or b"{}")
+
+
+class WikidataHandler(StubHandler):
+    def do_GET(self):
+        if not self.simulate():
+            return
+        url = urlparse(self.path)
+        query = parse_qs(url.query)
+        if url.path == "/w/index.php":
+            self.reply(200, "text/html", self.searchPage(unquote_plus(query.get("search", [""])[0])))
+        elif url.path.startswith("/wiki/"):
+            name = self.server.byId.get(url.path[len("/wiki/"):])
+            if name is None:
+                self.reply(404, "text/html", "<html></html>")
+                return
+            label = self.server.fixtures[name]["labels"].get(query.get("uselang", ["en"])[0], name)
+            self.reply(200, "text/html",
+                       f'<html><h1><span class="wikibase-title-label">{label}</span></h1></html>')
+        else:
+            self.reply(404, "text/html", "<html></html>")
+
+    def searchPage(self, term):
+        server = self.server
+        lower = term.lower()
+        if lower in server.byLowerName:
+            names = [server.byLowerName[lower]]
+        else:
+            names = [name for name in server.fixtures if lower in name.lower() or name.lower() in lower][:5]
+        items = "".join(
+            f'<li><div class="mw-search-result-heading"><a href="/wiki/{server.fixtures[name]["id"]}">{name}</a></div>'
+            f'<div class="mw-search-result-data">{10 + idx} statements, {20 - idx} sitelinks</div></li>'
+            for idx, name in enumerate(names)
+        )
+        return f'<html><ul class="mw-search-results">{items}</ul></html>'
+
+
+class ChatHandler(StubHandler):
+    def do_POST(self):
+        if not self.simulate():
+            return
+        body = self.readJson()
+        if self.path.endswith("/chat/completions"):
+            self.reply(200, "application/json", self.chatCompletion(body))
+        elif self.path.endswith("/services/aigc/text-generation/generation"):
+            self.reply(200, "application/json", self.dashscopeGeneration(body))
+        else:
+            self.reply(404, "application/json", {"error": "not found"})
+
+    def chatCompletion(self, body):
+        messages = body.get("messages", [])
+        system = " ".join(m["content"] for m in messages if m["role"] == "system")
+        user = messages[-1]["content"] if messages else ""
+        if "named entities" in system:
+            content = repr(self.server.namesIn(user))
+        else:
+            content = user
+        return {
+            "id": "chatcmpl-stub",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body.get("model", "stub"),
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+            "usage": {"prompt_tokens": len(user.split()), "completion_tokens": len(content.split()),
+                      "total_tokens": len(user.split()) + len(content.split())},
+        }
+
+    def dashscopeGeneration(self, body):
+        prompt = body.get("input", {}).get("prompt", "")
+        match = re.search(r"Sentence: (.*)", prompt)
+        text = match.group(1).strip() if match else prompt.strip().split("\n")[-1]
+        return {
+            "status_code": 200,
+            "request_id": "stub",
+            "output": {"text": text, "finish_reason": "stop"},
+            "usage": {"input_tokens": len(prompt.split()), "output_tokens": len(text.split())},
+        }
+
+
+class OllamaHandler(StubHandler):
+    def do_POST(self):
+        if not self.simulate():
+            return
+        if self.path != "/api/generate":
+            self.reply(404, "application/json", {"error": "not found"})
+            return
+        body = self.readJson()
+        prompt = body.get("prompt", "")
+        match = re.search(r"Text: '(.*)'", prompt)
+        text = match.group(1) if match else prompt.strip().split("\n")[-1]
+        self.reply(200, "application/json", {
+            "model": body.get("model", "stub"),
+            "created_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+            "response": f"<think>\nstub\n</think>\n{text}",
+            "done": True,
+        })
+
+
+HANDLERS = {
+    "wikidata": WikidataHandler,
+    "chat": ChatHandler,
+    "ollama": OllamaHandler,
+}
+
+
+def startStubs(fixtures, config=None, host="127.0.0.1"):
+    # config maps a stub name to {"latency", "jitter", "error_rate", "port"}.
+    config = config or {}
+    servers = {}
+    for name, handler in HANDLERS.items():
+        options = dict(config.get(name, {}))
+        port = options.pop("port", 0)
+        server = StubServer((host, port), handler, fixtures, **options)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        servers[name] = server
+    return servers
+
+
+def stopStubs(servers):
+    for server in servers.values():
+        server.shutdown()
+        server.server_close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the local Wikidata, chat and Ollama stubs.")
+    parser.add_argument("--split", default="validation")
+    parser.add_argument("--latency", type=float, default=0.0)
+    parser.add_argument("--jitter", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--wikidata-port", type=int, default=8801)
+    parser.add_argument("--chat-port", type=int, default=8802)
+    parser.add_argument("--ollama-port", type=int, default=8803)
+    args = parser.parse_args()
+
+    fixtures = buildFixtures(args.split)
+    common = {"latency": args.latency, "jitter": args.jitter, "error_rate": args.error_rate}
+    servers = startStubs(fixtures, {
+        "wikidata": dict(common, port=args.wikidata_port),
+        "chat": dict(common, port=args.chat_port),
+        "ollama": dict(common, port=args.ollama_port),
+    })
+    for name, server in servers.items():
+        print(f"{name}: {server.url}")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        stopStubs(servers)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,15 +1,12 @@
 import json
 import requests
-from bs4 import BeautifulSoup
 import re
-from fuzzywuzzy import fuzz
+from nerStore import openNerDict
 
 langList = ['tr_TR','zh_TW']
 lang = "zh_TW"
 modelName = "DeepSeek(zh&tr)"
 
-myDict = {}
-
 CountryDict={
     "ar_AE":"ar",
     "de_DE":"de",
@@ -21,17 +18,23 @@ CountryDict={
     "th_TH":"th",
     "tr_TR":"tr",
     "zh_TW":"zh-hant",
+    "ar":"ar",
+    "de":"de",
+    "es":"es",
+    "fr":"fr",
+    "it":"it",
+    "ja":"ja",
+    "ko":"ko",
+    "th":"th",
+    "tr":"tr",
     "zh":"zh-hant"
 }
 
-with open(NerDict_jsonl_file, 'r', encoding='utf-8') as file:
-    for line in file:
-        
-        data = json.loads(line.strip())
-        
-        key = data.get('ne')
-        if key:
-            myDict[key] = data
+wikidata_url = "https://www.wikidata.org"
+ollama_url = "http://localhost:11434/api/generate"
+
+# Compiled to a memory-mapped store on first use; see nerStore.py.
+myDict = openNerDict(NerDict_jsonl_file)
 
 def clean_translated_name(translated_name):
     if not translated_name:
@@ -46,7 +49,10 @@ def clean_translated_name(translated_name):
     return cleaned_name
 
 def query_wikidata_translation(entity_name, target_lang):
-    search_url = f"https://www.wikidata.org/w/index.php?search={entity_name}&ns0=1"
+    from bs4 import BeautifulSoup
+    from fuzzywuzzy import fuzz
+
+    search_url = f"{wikidata_url}/w/index.php?search={entity_name}&ns0=1"
     headers = {
         "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/132.0.0.0 Safari/537.36",
         "Accept-Language": target_lang,  
@@ -98,7 +104,7 @@ def query_wikidata_translation(entity_name, target_lang):
         print(f"No results found for {entity_name}.")
         return None,None
 
-    entity_url = "https://www.wikidata.org" + link["href"]+f"?uselang={target_lang}"
+    entity_url = wikidata_url + link["href"]+f"?uselang={target_lang}"
 
     response = requests.get(entity_url, headers=headers)
 
@@ -163,14 +169,11 @@ def write_to_txt(sentences, file_path):
             f.write(sentence + '\n')
 
 def translate_with_DeepSeek(sentence,targetLang):
-    url = "http://localhost:11434/api/generate"
     tmpNeTrans = ""
     tmpNe = ""
-    for ne in myDict.keys():
-        if ne in sentence:
-            tmpNeTrans = myDict[ne][targetLang]
-            tmpNe = ne
-            break
+    matches = myDict.findIn(sentence, targetLang)
+    if matches:
+        tmpNe, tmpNeTrans = matches[0]
     data = {
         "model": "deepseek-r1:70b",  
         "prompt": f"""Translate the following English text to {CountryDict[targetLang]}, using the given entity translation dictionary.
@@ -182,7 +185,7 @@ def translate_with_DeepSeek(sentence,targetLang):
         "stream": False  
     }
 
-    response = requests.post(url, json=data)
+    response = requests.post(ollama_url, json=data)
     translated = response.json()["response"]
     translated = re.sub(r"</think>.*?</think>", "", translated, flags=re.DOTALL)
     translated = [line.strip() for line in translated.split("\n") if line.strip()]
@@ -0,0 +1,427 @@
+"""
+Per-instance evaluation results stored as Parquet, one file per system and target language:
+
+    data/results/{split}/{system}/{target_language}.parquet
+
+Each row is one reference instance with the columns `id`, `wikidata_id`, `entity_types`,
+`locale`, `system`, `has_prediction`, `entity_hit` (the M-ETA outcome of the instance) and
+`comet` (the maximum COMET score over the references, null until COMET has been run).
+The query helpers below compute system scores, per-entity-type breakdowns and
+system-vs-system win/loss counts from these files without re-scoring anything.
+
+Usage:
+    python results_store.py score --split validation
+    python results_store.py summary --split validation
+    python results_store.py types --split validation
+    python results_store.py compare --split validation SYSTEM_A SYSTEM_B
+"""
+import argparse
+import glob
+import json
+import os
+from typing import Dict, List, Optional
+
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "data")
+
+SCHEMA = pa.schema(
+    [
+        ("id", pa.string()),
+        ("wikidata_id", pa.string()),
+        ("entity_types", pa.list_(pa.string())),
+        ("locale", pa.string()),
+        ("system", pa.string()),
+        ("has_prediction", pa.bool_()),
+        ("entity_hit", pa.bool_()),
+        ("comet", pa.float64()),
+    ]
+)
+
+
+def load_jsonl_by_id(input_path: str) -> Dict[str, dict]:
+    """
+    Load a JSONL file (references or predictions) into a dictionary keyed by instance ID.
+
+    Args:
+        input_path (str): Path to the input file.
+
+    Returns:
+        Dict[str, dict]: Dictionary with the instance ID as key and the JSON object as value.
+    """
+    data = {}
+
+    with open(input_path, encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+
+            line_data = json.loads(line)
+            data[line_data["id"]] = line_data
+
+    return data
+
+
+def results_path(results_dir: str, system: str, locale: str) -> str:
+    """
+    Path of the Parquet file holding the results of a system in a target language.
+
+    Args:
+        results_dir (str): Root directory of the results of a split.
+        system (str): System name, i.e. the path under data/predictions (may contain "/").
+        locale (str): Target language, e.g. "it_IT".
+
+    Returns:
+        str: Path to the Parquet file.
+    """
+    return os.path.join(results_dir, system, f"{locale}.parquet")
+
+
+def build_instance_table(
+    system: str,
+    locale: str,
+    references: Dict[str, dict],
+    predictions: Dict[str, dict],
+) -> pa.Table:
+    """
+    Compute the per-instance entity outcome of a system, as in `compute_entity_name_translation_accuracy`:
+    an instance is a hit if any gold mention is a (casefolded) substring of the prediction.
+
+    Args:
+        system (str): System name.
+        locale (str): Target language.
+        references (Dict[str, dict]): References keyed by instance ID.
+        predictions (Dict[str, dict]): Predictions keyed by instance ID.
+
+    Returns:
+        pa.Table: One row per reference instance with an empty `comet` column.
+    """
+    rows = {name: [] for name in SCHEMA.names}
+
+    for instance_id, reference in references.items():
+        # Instances with an empty target list are skipped by the M-ETA evaluation as well.
+        if not reference["targets"]:
+            continue
+
+        prediction = predictions.get(instance_id)
+        entity_hit = False
+        if prediction is not None:
+            normalized_translation = prediction["prediction"].casefold()
+            entity_hit = any(
+                target["mention"].casefold() in normalized_translation
+                for target in reference["targets"]
+            )
+
+        rows["id"].append(instance_id)
+        rows["wikidata_id"].append(reference["wikidata_id"])
+        rows["entity_types"].append(reference["entity_types"])
+        rows["locale"].append(locale)
+        rows["system"].append(system)
+        rows["has_prediction"].append(prediction is not None)
+        rows["entity_hit"].append(entity_hit)
+        rows["comet"].append(None)
+
+    return pa.table(rows, schema=SCHEMA)
+
+
+def write_instance_table(table: pa.Table, results_dir: str, system: str, locale: str) -> str:
+    """
+    Write the per-instance results of a system, keeping COMET scores already stored for it.
+
+    Args:
+        table (pa.Table): Table built by `build_instance_table`.
+        results_dir (str): Root directory of the results of a split.
+        system (str): System name.
+        locale (str): Target language.
+
+    Returns:
+        str: Path to the written Parquet file.
+    """
+    path = results_path(results_dir, system, locale)
+
+    if os.path.exists(path):
+        previous = pq.read_table(path, columns=["id", "comet"]).to_pydict()
+        scores = dict(zip(previous["id"], previous["comet"]))
+        comet = [scores.get(instance_id) for instance_id in table.column("id").to_pylist()]
+        table = table.set_column(
+            SCHEMA.get_field_index("comet"), "comet", pa.array(comet, type=pa.float64())
+        )
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    pq.write_table(table, path)
+    return path
+
+
+def save_entity_results(
+    path_to_references: str,
+    path_to_predictions: str,
+    system: str,
+    locale: str,
+    results_dir: str,
+) -> str:
+    """
+    Score the predictions of a system for M-ETA and store the per-instance outcomes.
+
+    Args:
+        path_to_references (str): Path to the references file.
+        path_to_predictions (str): Path to the predictions file.
+        system (str): System name.
+        locale (str): Target language.
+        results_dir (str): Root directory of the results of a split.
+
+    Returns:
+        str: Path to the written Parquet file.
+    """
+    references = load_jsonl_by_id(path_to_references)
+    predictions = load_jsonl_by_id(path_to_predictions)
+    table = build_instance_table(system, locale, references, predictions)
+    return write_instance_table(table, results_dir, system, locale)
+
+
+def save_comet_scores(
+    results_dir: str,
+    system: str,
+    locale: str,
+    scores: Dict[str, float],
+) -> str:
+    """
+    Store per-instance COMET scores (the maximum over the references of an instance) next to
+    the entity outcomes. `save_entity_results` must have been run for the system first.
+
+    Args:
+        results_dir (str): Root directory of the results of a split.
+        system (str): System name.
+        locale (str): Target language.
+        scores (Dict[str, float]): COMET score by instance ID.
+
+    Returns:
+        str: Path to the updated Parquet file.
+    """
+    path = results_path(results_dir, system, locale)
+    table = pq.read_table(path, schema=SCHEMA)
+    comet = [scores.get(instance_id) for instance_id in table.column("id").to_pylist()]
+    table = table.set_column(
+        SCHEMA.get_field_index("comet"), "comet", pa.array(comet, type=pa.float64())
+    )
+    pq.write_table(table, path)
+    return path
+
+
+def find_systems(data_dir: str, split: str) -> Dict[str, List[str]]:
+    """
+    Find every system with predictions for a split, i.e. every data/predictions/{system}/{split}/ directory.
+
+    Args:
+        data_dir (str): Path to the data directory.
+        split (str): Split name, e.g. "validation".
+
+    Returns:
+        Dict[str, List[str]]: Target languages with predictions, by system name.
+    """
+    predictions_dir = os.path.join(data_dir, "predictions")
+    systems = {}
+
+    for path in sorted(glob.glob(os.path.join(predictions_dir, "**", split, "*.jsonl"), recursive=True)):
+        system_dir = os.path.dirname(os.path.dirname(path))
+        system = os.path.relpath(system_dir, predictions_dir).replace(os.sep, "/")
+        locale = os.path.splitext(os.path.basename(path))[0]
+        systems.setdefault(system, []).append(locale)
+
+    return systems
+
+
+def score_all_systems(data_dir: str, split: str, results_dir: str) -> List[str]:
+    """
+    Store the per-instance M-ETA outcomes of every system that has predictions for a split.
+
+    Args:
+        data_dir (str): Path to the data directory.
+        split (str): Split name.
+        results_dir (str): Root directory of the results of the split.
+
+    Returns:
+        List[str]: Paths to the written Parquet files.
+    """
+    written = []
+
+    for system, locales in find_systems(data_dir, split).items():
+        for locale in locales:
+            path_to_references = os.path.join(data_dir, "references", split, f"{locale}.jsonl")
+            if not os.path.exists(path_to_references):
+                print(f"No references for {split}/{locale}, skipping {system}")
+                continue
+
+            path_to_predictions = os.path.join(data_dir, "predictions", system, split, f"{locale}.jsonl")
+            written.append(
+                save_entity_results(path_to_references, path_to_predictions, system, locale, results_dir)
+            )
+
+    return written
+
+
+def load_results(
+    results_dir: str,
+    systems: Optional[List[str]] = None,
+    locales: Optional[List[str]] = None,
+) -> pa.Table:
+    """
+    Load the stored per-instance results, optionally restricted to some systems and target languages.
+
+    Args:
+        results_dir (str): Root directory of the results of a split.
+        systems (Optional[List[str]]): Systems to load; all if None.
+        locales (Optional[List[str]]): Target languages to load; all if None.
+
+    Returns:
+        pa.Table: Concatenated per-instance results.
+    """
+    tables = []
+
+    for path in sorted(glob.glob(os.path.join(results_dir, "**", "*.parquet"), recursive=True)):
+        system = os.path.relpath(os.path.dirname(path), results_dir).replace(os.sep, "/")
+        locale = os.path.splitext(os.path.basename(path))[0]
+        if systems and system not in systems:
+            continue
+        if locales and locale not in locales:
+            continue
+        tables.append(pq.read_table(path, schema=SCHEMA))
+
+    if not tables:
+        return SCHEMA.empty_table()
+    return pa.concat_tables(tables)
+
+
+def aggregate(table: pa.Table, by: List[str] = ["system", "locale"]) -> pa.Table:
+    """
+    Compute M-ETA and the average COMET score per group.
+
+    Args:
+        table (pa.Table): Per-instance results.
+        by (List[str]): Columns to group by, e.g. ["system"] or ["system", "locale"].
+
+    Returns:
+        pa.Table: One row per group with `instances`, `m_eta`, `comet` and the harmonic mean `final_score`.
+    """
+    table = table.set_column(
+        table.schema.get_field_index("entity_hit"),
+        "entity_hit",
+        pc.cast(table.column("entity_hit"), pa.float64()),
+    )
+    grouped = table.group_by(by).aggregate(
+        [("id", "count"), ("entity_hit", "mean"), ("comet", "mean")]
+    )
+    grouped = grouped.rename_columns(
+        [{"id_count": "instances", "entity_hit_mean": "m_eta", "comet_mean": "comet"}.get(name, name)
+         for name in grouped.column_names]
+    )
+
+    m_eta = grouped.column("m_eta")
+    comet = grouped.column("comet")
+    final_score = pc.divide(pc.multiply(pc.multiply(m_eta, comet), 2.0), pc.add(m_eta, comet))
+    return grouped.append_column("final_score", final_score).sort_by([(name, "ascending") for name in by])
+
+
+def per_entity_type(table: pa.Table, by: List[str] = ["system"]) -> pa.Table:
+    """
+    Compute `aggregate` per entity type; an instance with several types counts for each of them.
+
+    Args:
+        table (pa.Table): Per-instance results.
+        by (List[str]): Columns to group by in addition to the entity type.
+
+    Returns:
+        pa.Table: One row per group and entity type.
+    """
+    entity_types = table.column("entity_types")
+    parents = pc.list_parent_indices(entity_types)
+    exploded = table.drop_columns(["entity_types"]).take(parents)
+    exploded = exploded.append_column("entity_type", pc.list_flatten(entity_types))
+    return aggregate(exploded, by=by + ["entity_type"])
+
+
+def win_loss(table: pa.Table, system_a: str, system_b: str, metric: str = "entity_hit") -> Dict[str, int]:
+    """
+    Compare two systems instance by instance on the instances both have results for.
+
+    Args:
+        table (pa.Table): Per-instance results.
+        system_a (str): First system.
+        system_b (str): Second system.
+        metric (str): "entity_hit" or "comet".
+
+    Returns:
+        Dict[str, int]: Number of instances where system_a wins, loses or ties against system_b.
+    """
+    columns = ["id", "locale", metric]
+    a = table.filter(pc.equal(table.column("system"), system_a)).select(columns)
+    b = table.filter(pc.equal(table.column("system"), system_b)).select(columns)
+    joined = a.join(b, keys=["id", "locale"], left_suffix="_a", right_suffix="_b", join_type="inner")
+    joined = joined.filter(pc.and_(pc.is_valid(joined.column(f"{metric}_a")), pc.is_valid(joined.column(f"{metric}_b"))))
+
+    score_a = pc.cast(joined.column(f"{metric}_a"), pa.float64())
+    score_b = pc.cast(joined.column(f"{metric}_b"), pa.float64())
+    wins = pc.sum(pc.greater(score_a, score_b)).as_py() or 0
+    losses = pc.sum(pc.less(score_a, score_b)).as_py() or 0
+
+    return {
+        "instances": joined.num_rows,
+        "wins": wins,
+        "losses": losses,
+        "ties": joined.num_rows - wins - losses,
+    }
+
+
+def format_table(table: pa.Table) -> str:
+    """
+    Format a table as aligned plain-text columns, with floats rounded to four decimals.
+
+    Args:
+        table (pa.Table): Table to format.
+
+    Returns:
+        str: The formatted table.
+    """
+    def cell(value) -> str:
+        if value is None:
+            return "-"
+        if isinstance(value, float):
+            return f"{value:.4f}"
+        return str(value)
+
+    rows = [table.column_names] + [
+        [cell(value) for value in row.values()] for row in table.to_pylist()
+    ]
+    widths = [max(len(row[i]) for row in rows) for i in range(len(table.column_names))]
+    return "\n".join("  ".join(value.ljust(width) for value, width in zip(row, widths)) for row in rows)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Store and query per-instance evaluation results.")
+    parser.add_argument("command", choices=["score", "summary", "types", "compare"])
+    parser.add_argument("systems", nargs="*", help="the two systems to compare")
+    parser.add_argument("--data-dir", default=DATA_DIR)
+    parser.add_argument("--split", default="validation")
+    parser.add_argument("--metric", default="entity_hit", choices=["entity_hit", "comet"])
+    args = parser.parse_intermixed_args()
+
+    results_dir = os.path.join(args.data_dir, "results", args.split)
+
+    if args.command == "score":
+        written = score_all_systems(args.data_dir, args.split, results_dir)
+        print(f"Wrote {len(written)} result files to {results_dir}")
+    elif args.command == "summary":
+        print(format_table(aggregate(load_results(results_dir))))
+    elif args.command == "types":
+        print(format_table(per_entity_type(load_results(results_dir))))
+    else:
+        if len(args.systems) != 2:
+            parser.error("compare needs exactly two systems")
+        system_a, system_b = args.systems
+        print(win_loss(load_results(results_dir, systems=[system_a, system_b]), system_a, system_b, args.metric))
+
+
+if __name__ == "__main__":
+    main()